@@ -0,0 +1,84 @@
+"""Measures the startup time of the pipeline and guards it against regressions.
+
+Every measurement imports the entry point in a fresh interpreter. The benchmark fails if one of the heavy modules
+that the pipeline does not need at startup is imported, or if the median import time exceeds --max-seconds.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.bench_import_time --repeat 5 --max-seconds 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# modules that must not be imported by main.py at startup, the mailchimp client is only imported to send
+FORBIDDEN_MODULES = ['seaborn', 'matplotlib', 'mailchimp_marketing', 'requests']
+
+MEASURE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(__import__('json').dumps({{'seconds': duration, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def measure_import(module, cwd='.'):
+    """Imports the module in a fresh interpreter.
+
+    Returns:
+        [tuple]: Import time in seconds and the names of all modules that were loaded.
+    """
+    out = subprocess.run([sys.executable, '-c', MEASURE.format(module=module)], cwd=cwd, check=True,
+                         capture_output=True, text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+
+    return result['seconds'], result['modules']
+
+
+def get_slowest_imports(module, cwd='.', top=10):
+    """Returns the top imports by cumulative time as reported by python -X importtime."""
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=cwd, check=True,
+                         capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=0.0, help='fail above this median, 0 disables it')
+    args = parser.parse_args()
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    timings = []
+    modules = []
+    for _ in range(args.repeat):
+        seconds, modules = measure_import(args.module, cwd)
+        timings.append(seconds)
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median:.3f}s, min {min(timings):.3f}s over {args.repeat} runs, "
+          f"{len(modules)} modules loaded")
+    print("slowest imports (cumulative):")
+    for micros, name in get_slowest_imports(args.module, cwd):
+        print(f"  {micros / 1e6:8.3f}s {name}")
+
+    failures = [f"{name} is imported at startup" for name in FORBIDDEN_MODULES
+                if any(loaded == name or loaded.startswith(name + '.') for loaded in modules)]
+    if args.max_seconds and median > args.max_seconds:
+        failures.append(f"median import time {median:.3f}s exceeds {args.max_seconds:.3f}s")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Benchmarks every stage of the pipeline from load_file() to process_to_mailchimp() and the senders end to end.
+
+The stages run on synthetic FundraisingBox and twingle exports, the senders send to the local mailchimp stand-in
+server (src/fake_mailchimp.py). For every stage the best time of --repeat runs, the throughput and the peak memory
+allocated by Python and numpy are reported. The results are compared to a stored baseline, timings above the
+baseline by more than --tolerance are marked as regressions.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.bench_pipeline --rows 10000 100000 --send-rows 1000
+    python -m benchmarks.bench_pipeline --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import src.helper_functions as hf
+import src.process_files as pf
+import src.sources as sr
+from src import fake_mailchimp as fm
+from . import generate_data as gd
+from .bench_process_files import COLS_FOR_CHIMP
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# same mapping as used by main.main
+COL_MAP_FOR_CHIMP = [('email_address', 'Email Address'), ('first_name', 'First Name'), ('last_name', 'Last Name'),
+                     ('address_for_chimp', 'Address'), ('address_for_chimp_dict', 'Address_dict'),
+                     ('phone', 'Phone'), ('spender_tag', 'Tags')]
+
+SOURCES = {
+    'FundraisingBox': (gd.generate_fundraisingbox, sr.get_transform('is_FundraisingBox')),
+    'twingle': (gd.generate_twingle, sr.get_transform('is_twingle')),
+}
+
+
+def measure(func, *args, repeat=3):
+    """Runs a function repeatedly and once more with tracemalloc.
+
+    Returns:
+        [tuple]: Result of the function, best wall time in seconds and peak traced memory in MB.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    # memory is measured in a separate run, tracing slows the allocations down
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+    return result, best, peak
+
+
+def add_result(results, key, rows, seconds, peak_mb=None):
+    results[key] = {'rows': rows, 'seconds': seconds, 'rows_per_s': rows / seconds if seconds > 0 else None,
+                    'peak_mb': peak_mb}
+    rate = f"{results[key]['rows_per_s']:,.0f}" if results[key]['rows_per_s'] else '-'
+    peak = f"{peak_mb:.1f}" if peak_mb is not None else '-'
+    print(f"{key:<40}{rows:>10}{seconds:>12.3f}{rate:>14}{peak:>12}")
+
+
+def bench_stages(source, n_rows, dup_rate, repeat, results):
+    """Times all stages of one file from load_file() to process_to_mailchimp(), in the current directory.
+
+    Returns:
+        [dataframe]: Contacts in the format returned by pf.process_to_mailchimp().
+    """
+    generate, transform = SOURCES[source]
+    fname = f'{source}_bench.csv'
+    gd.to_export(generate(n_rows, dup_rate=dup_rate), os.path.join('data', fname))
+
+    df_file, seconds, peak = measure(hf.load_file, fname, 'data/', ';', repeat=repeat)
+    add_result(results, f'{source}/{n_rows}/load', len(df_file), seconds, peak)
+    df_clean, seconds, peak = measure(transform, df_file, repeat=repeat)
+    add_result(results, f'{source}/{n_rows}/transform', len(df_file), seconds, peak)
+
+    def dedupe():
+        return pf.add_spender_tags(pf.aggregate_per_mailadress(df_clean, COLS_FOR_CHIMP))
+
+    df_agg, seconds, peak = measure(dedupe, repeat=repeat)
+    add_result(results, f'{source}/{n_rows}/dedupe', len(df_clean), seconds, peak)
+    df_final, seconds, peak = measure(pf.process_to_mailchimp, df_agg, COL_MAP_FOR_CHIMP,
+                                      f'{source}_bench_processed.csv', repeat=repeat)
+    add_result(results, f'{source}/{n_rows}/write', len(df_agg), seconds, peak)
+
+    return df_final
+
+
+def prepare_contacts(n_rows, dup_rate):
+    """Runs the pipeline on a generated FundraisingBox export without timing it and returns the contacts."""
+    df_clean = sr.get_transform('is_FundraisingBox')(gd.generate_fundraisingbox(n_rows, dup_rate=dup_rate))
+    df_agg = pf.add_spender_tags(pf.aggregate_per_mailadress(df_clean, COLS_FOR_CHIMP))
+
+    return pf.process_to_mailchimp(df_agg, COL_MAP_FOR_CHIMP, 'FundraisingBox_send_processed.csv')
+
+
+def bench_send(df_final, send_modes, results):
+    """Sends the contacts with every sender to a fresh local stand-in server and checks that all arrived."""
+    for send_mode in send_modes:
+        server, api_url = fm.start_server()
+        send_opts = {'host': api_url}
+        if send_mode == 'concurrent':
+            send_opts['rate_limit'] = 10000.0
+        if send_mode == 'bulk':
+            send_opts['poll_interval'] = 0.05
+        try:
+            start = time.perf_counter()
+            errors = pf.get_sender(send_mode)(df_final, 'bench', 'key-us1', 'us1', **send_opts)
+            seconds = time.perf_counter() - start
+            n_members = len(server.state.get_list('bench'))
+        finally:
+            server.shutdown()
+            server.server_close()
+        if errors or n_members != len(df_final):
+            raise AssertionError(f"send {send_mode}: {len(errors)} errors, {n_members} of {len(df_final)} arrived")
+        add_result(results, f'send/{send_mode}/{len(df_final)}', len(df_final), seconds)
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Prints the timings relative to the baseline.
+
+    Returns:
+        [list]: Keys of the results that are slower than the baseline by more than the tolerance.
+    """
+    regressions = []
+    print(f"\n{'compared to baseline':<40}{'baseline [s]':>14}{'now [s]':>12}{'ratio':>10}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result['seconds'] / max(baseline[key]['seconds'], 1e-9)
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f"{key:<40}{baseline[key]['seconds']:>14.3f}{result['seconds']:>12.3f}{ratio:>9.2f}x{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--dup-rate', type=float, default=0.3)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--send-rows', type=int, default=1000, help='donations sent per sender, 0 skips it')
+    parser.add_argument('--send-modes', nargs='+', default=['serial', 'concurrent', 'bulk'])
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 means 25%%')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # process_to_mailchimp() writes into data/ of the current directory
+        os.chdir(tmp_dir)
+        os.mkdir('data')
+        try:
+            print(f"{'stage':<40}{'rows':>10}{'time [s]':>12}{'rows/s':>14}{'peak [MB]':>12}")
+            for n_rows in args.rows:
+                for source in SOURCES:
+                    bench_stages(source, n_rows, args.dup_rate, args.repeat, results)
+            if args.send_rows:
+                bench_send(prepare_contacts(args.send_rows, args.dup_rate), args.send_modes, results)
+        finally:
+            os.chdir(cwd)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f)['results'], args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results},
+                      f, indent=2)
+        print(f"\nBaseline written to {args.baseline}.")
+    if regressions:
+        print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+
+if __name__ == "__main__":
+    main()
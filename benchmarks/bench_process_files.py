@@ -0,0 +1,116 @@
+"""Benchmarks the vectorized transforms against their row-wise reference implementations.
+
+The source transforms are compiled from the declarations in src/sources.py, they are compared on the columns they
+return, legacy.from_fundraisingbox() and legacy.from_twingle() return all columns of the export as well.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.bench_process_files --rows 1000 10000 100000
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import pandas as pd
+import src.helper_functions as hf
+import src.process_files as pf
+import src.sources as sr
+from . import generate_data as gd
+from . import legacy_process_files as legacy
+
+# same columns as used by main.main
+COLS_FOR_CHIMP = ['email_address', 'first_name', 'last_name', 'address_for_chimp', 'address_for_chimp_dict',
+                  'phone', 'donation_id', 'ist_dauerspender', 'ist_einzelspender']
+
+
+def time_call(func, *args, repeat=3):
+    """Returns the result and the best wall time in seconds of several calls of a function."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func(*args)
+            best = min(best, time.perf_counter() - start)
+
+    return result, best
+
+
+def load_generated(df_generated, tmp_dir, fname):
+    """Writes a generated export and reads it back like main.process_file does, so dtypes are realistic."""
+    gd.to_export(df_generated, os.path.join(tmp_dir, fname))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return hf.load_file(fname, tmp_dir + '/', ';')
+
+
+def bench_load(name, fname, tmp_dir, what_file, repeat):
+    """Times loading an export untyped and with the schema of its source and reports the memory of the result."""
+    schema = sr.get_source(what_file).schema
+    variants = [('untyped', {}), ('typed', {'schema': schema})]
+    try:
+        import pyarrow
+        variants.append(('typed pyarrow', {'schema': schema, 'engine': 'pyarrow'}))
+    except ImportError:
+        pass
+    for variant, kwargs in variants:
+        df_file, t_load = time_call(lambda: hf.load_file(fname, tmp_dir + '/', ';', **kwargs), repeat=repeat)
+        memory = df_file.memory_usage(deep=True).sum() / 1e6
+        print(f"{'load ' + name + ' ' + variant:<40}{len(df_file):>10}{t_load:>12.3f}{memory:>12.1f}")
+
+
+def by_mail_address(df_agg):
+    """Drops the subscriber hash and sorts by mail address, as the reference implementation groups on the raw
+        mail address. The generated mail addresses are already normalized, so the rows must be the same.
+    """
+    return df_agg.drop(columns='subscriber_hash').sort_values('email_address').reset_index(drop=True)
+
+
+def output_columns(df_clean):
+    """Selects the columns a compiled source transform returns."""
+    return df_clean[sr.OUTPUT_COLUMNS]
+
+
+def bench_transform(name, legacy_func, new_func, df_file, repeat, *args, compare_as=None, legacy_as=None):
+    """Times both implementations of a transform and checks that they return the same dataframe, after
+        compare_as was applied to the new one and legacy_as to the legacy one if given.
+    """
+    df_legacy, t_legacy = time_call(legacy_func, df_file, *args, repeat=repeat)
+    df_new, t_new = time_call(new_func, df_file, *args, repeat=repeat)
+    pd.testing.assert_frame_equal(compare_as(df_new) if compare_as else df_new,
+                                  legacy_as(df_legacy) if legacy_as else df_legacy)
+    print(f"{name:<28}{len(df_file):>10}{t_legacy:>12.3f}{t_new:>12.3f}{t_legacy / max(t_new, 1e-9):>10.1f}x")
+
+    return df_new
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'transform':<28}{'rows':>10}{'legacy [s]':>12}{'new [s]':>12}{'speedup':>11}")
+        for n_rows in args.rows:
+            df_fund = load_generated(gd.generate_fundraisingbox(n_rows), tmp_dir, 'FundraisingBox_bench.csv')
+            df_fund_clean = bench_transform('from_fundraisingbox', legacy.from_fundraisingbox,
+                                            sr.get_transform('is_FundraisingBox'), df_fund, args.repeat,
+                                            legacy_as=output_columns)
+            bench_transform('process_to_one_mailadress', legacy.process_to_one_mailadress,
+                            pf.process_to_one_mailadress, df_fund_clean, args.repeat, COLS_FOR_CHIMP,
+                            compare_as=by_mail_address)
+            df_twing = load_generated(gd.generate_twingle(n_rows), tmp_dir, 'twingle_bench.csv')
+            bench_transform('from_twingle', legacy.from_twingle, sr.get_transform('is_twingle'), df_twing,
+                            args.repeat, legacy_as=output_columns)
+
+        print(f"\n{'load':<40}{'rows':>10}{'time [s]':>12}{'memory [MB]':>12}")
+        for n_rows in args.rows:
+            gd.to_export(gd.generate_fundraisingbox(n_rows), os.path.join(tmp_dir, 'FundraisingBox_bench.csv'))
+            bench_load('FundraisingBox', 'FundraisingBox_bench.csv', tmp_dir, 'is_FundraisingBox', args.repeat)
+            gd.to_export(gd.generate_twingle(n_rows), os.path.join(tmp_dir, 'twingle_bench.csv'))
+            bench_load('twingle', 'twingle_bench.csv', tmp_dir, 'is_twingle', args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Generators for synthetic FundraisingBox and twingle exports that look like the real ones.
+
+Can also write exports to a folder, e.g. to try out main.py on a copy of the data folder:
+    python -m benchmarks.generate_data --rows 100000 --dup-rate 0.3 --out ./data/
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannes', 'Ida', 'Jonas', 'Lea', 'Max']
+LAST_NAMES = ['Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Schulz', 'Hoffmann']
+CITIES = ['Berlin', 'Hamburg', 'München', 'Köln', 'Leipzig', 'Augsburg', 'Hannover', 'Freiburg']
+STREETS = ['Hauptstraße', 'Bahnhofstraße', 'Schulstraße', 'Gartenweg', 'Lindenallee', 'Am Markt']
+
+
+def get_mail_pool(n_rows, dup_rate, rng):
+    """Draws one mail address per row from a pool that is small enough to reach the given duplicate rate."""
+    n_unique = max(1, int(round(n_rows * (1 - dup_rate))))
+    pool = np.array([f'spender{i}@example.org' for i in range(n_unique)], dtype=object)
+    # every address is used at least once, the remaining rows reuse random addresses
+    idx = np.concatenate([np.arange(min(n_unique, n_rows)), rng.integers(0, n_unique, max(0, n_rows - n_unique))])
+    rng.shuffle(idx)
+
+    return pool[idx]
+
+
+def generate_fundraisingbox(n_rows, dup_rate=0.3, nl_rate=0.6, seed=0):
+    """Generates a synthetic FundraisingBox export.
+
+    Args:
+        n_rows ([int]): Number of donations.
+        dup_rate (float, optional): Share of donations made by a donor that already donated. Defaults to 0.3.
+        nl_rate (float, optional): Share of donations where the donor wants the newsletter. Defaults to 0.6.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        [dataframe]: Dataframe with the columns of a FundraisingBox export.
+    """
+    rng = np.random.default_rng(seed)
+    donation_ids = 12300000 + np.arange(n_rows)
+    wants_nl = rng.random(n_rows) < nl_rate
+    has_meta = rng.random(n_rows) < 0.95
+    meta_infos = [json.dumps({"wants_newsletter": '1' if nl else '', "item_id": 34395,
+                              "item_name": "Seebrücke unterstützen"}) if meta else np.nan
+                  for nl, meta in zip(wants_nl, has_meta)]
+    post_codes = np.array([f'{code:05d}' for code in rng.integers(1000, 99999, n_rows)], dtype=object)
+    post_codes[rng.random(n_rows) < 0.05] = None
+
+    return pd.DataFrame({
+        'donation_id': donation_ids,
+        'ident_id': [f'FB-{i}' for i in range(n_rows)],
+        'external_donation_id': np.nan,
+        'transaction_id': [f'FB-T-{9500000 + i}' for i in range(n_rows)],
+        'status': 'confirmed',
+        'donated_at': '2021-04-10 15:10:59',
+        'amount': rng.integers(5, 200, n_rows).astype(float),
+        'interval': np.where(rng.random(n_rows) < 0.3, 'monthly', ''),
+        'by_recurring': np.where(rng.random(n_rows) < 0.3, 1.0, np.nan),
+        'email_address': get_mail_pool(n_rows, dup_rate, rng),
+        'first_name': rng.choice(FIRST_NAMES, n_rows),
+        'last_name': rng.choice(LAST_NAMES, n_rows),
+        'phone': np.where(rng.random(n_rows) < 0.2, '0151 2345678', None),
+        'address': [f'{street} {number}' for street, number in
+                    zip(rng.choice(STREETS, n_rows), rng.integers(1, 120, n_rows))],
+        'city': rng.choice(CITIES, n_rows),
+        'state': np.nan,
+        'post_code': post_codes,
+        'country': 'DE',
+        'donation_meta_info': meta_infos,
+        'Lokalgruppe': rng.choice(['Augsburg', 'Berlin', ''], n_rows),
+    })
+
+
+def generate_twingle(n_rows, dup_rate=0.3, nl_rate=0.6, seed=0):
+    """Generates a synthetic twingle export.
+
+    Args:
+        n_rows ([int]): Number of transactions.
+        dup_rate (float, optional): Share of transactions made by a donor that already donated. Defaults to 0.3.
+        nl_rate (float, optional): Share of transactions where the donor wants the newsletter. Defaults to 0.6.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        [dataframe]: Dataframe with the columns of a twingle export.
+    """
+    rng = np.random.default_rng(seed)
+    newsletter = np.where(rng.random(n_rows) < nl_rate, 1.0, 0.0)
+    newsletter[rng.random(n_rows) < 0.05] = np.nan
+
+    return pd.DataFrame({
+        'trx_id': 5400000 + np.arange(n_rows),
+        'created_at': '2021-04-10 15:10:59',
+        'amount': rng.integers(5, 200, n_rows).astype(float),
+        'currency': 'EUR',
+        'payment_method': rng.choice(['paypal', 'debit', 'sofort'], n_rows),
+        'recurring': np.where(rng.random(n_rows) < 0.3, 1, 0),
+        'user_email': get_mail_pool(n_rows, dup_rate, rng),
+        'user_firstname': rng.choice(FIRST_NAMES, n_rows),
+        'user_lastname': rng.choice(LAST_NAMES, n_rows),
+        'user_telephone': np.where(rng.random(n_rows) < 0.2, '0151 2345678', None),
+        'user_street': [f'{street} {number}' for street, number in
+                        zip(rng.choice(STREETS, n_rows), rng.integers(1, 120, n_rows))],
+        'user_city': rng.choice(CITIES, n_rows),
+        'user_postal_code': rng.integers(10000, 99999, n_rows),
+        'user_country': 'DE',
+        'newsletter': newsletter,
+        'purpose': 'Seebrücke unterstützen',
+    })
+
+
+def to_export(df_input, fname, delimiter=';'):
+    """Writes a generated dataframe as csv file like the exports of the platforms and returns the file name."""
+    df_input.to_csv(fname, sep=delimiter, index=False)
+
+    return fname
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--dup-rate', type=float, default=0.3)
+    parser.add_argument('--nl-rate', type=float, default=0.6)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='./')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, generate in [('FundraisingBox', generate_fundraisingbox), ('twingle', generate_twingle)]:
+        df_export = generate(args.rows, args.dup_rate, args.nl_rate, args.seed)
+        print(f"Written {to_export(df_export, os.path.join(args.out, f'{name}_generated_{args.rows}.csv'))}")
+
+
+if __name__ == "__main__":
+    main()
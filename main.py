@@ -1,10 +1,151 @@
+import logging
 import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 from environs import Env
 import src.process_files as pf
 import src.helper_functions as hf
+import src.sources as sr
+import src.send_journal as sj
+import src.resilience as rs
+import src.metrics as mt
+import src.logging_setup as ls
+import src.debug_snapshots as ds
+import src.watcher as wt
+import src.targets as tg
+import src.archive_index as ai
+
+logger = logging.getLogger(__name__)
+
+def load_and_aggregate(cols_for_chimp, data_path, file, mode, what_file, chunksize=0, typed_load=False,
+                       csv_engine=None):
+    """Loads one file, extracts the relevant data and aggregates it to one row per mail address.
+
+    Args:
+        cols_for_chimp ([list]): Columns names of cols to be used from the transformded input file.
+        data_path ([str]): Path to the csv files.
+        file ([str]): File that shall be processed.
+        mode ([str]): Shall debugging take place or not? For debugging enter "DEBUG" in the .env file as MODE.
+        what_file ([str]): Source key of the platform the file is from, e.g. 'is_twingle', see src/sources.py.
+        chunksize (int, optional): If greater than 0, the file is streamed in chunks of this many rows, so that
+            the memory needed is bounded by the number of unique mail addresses. Defaults to 0.
+        typed_load (bool, optional): Read only the used columns with the dtypes from src/schemas.py. Always on
+            with chunksize. Defaults to False.
+        csv_engine (str, optional): Parser engine for the csv files, e.g. 'pyarrow'. Defaults to None.
+
+    Returns:
+        [dataframe]: Aggregate per mail address as returned by pf.aggregate_per_mailadress().
+    """
+    transform = sr.get_transform(what_file)
+    # pandas infers the dtypes of every chunk on its own, e.g. a postal code is 9848 in one chunk and 9848.0 in the
+    # next, so chunks are always read with the dtypes of the source
+    schema = sr.get_source(what_file).schema if typed_load or chunksize else None
+    if chunksize:
+        chunks = hf.load_file(file, data_path, ';', chunksize, schema, csv_engine)
+        return pf.aggregate_chunks_per_mailadress(chunks, transform, cols_for_chimp, mode)
+
+    with mt.METRICS.stage('load') as stage:
+        df_file = hf.load_file(file, data_path, ';', schema=schema, engine=csv_engine)
+        stage['rows_out'] = len(df_file)
+    with mt.METRICS.stage('transform', len(df_file)) as stage:
+        df_clean = transform(df_file, mode)
+        stage['rows_out'] = len(df_clean)
+    with mt.METRICS.stage('dedupe', len(df_clean)) as stage:
+        df_agg = pf.aggregate_per_mailadress(df_clean, cols_for_chimp)
+        stage['rows_out'] = len(df_agg)
+
+    return df_agg
+
+
+def send_contacts(df_final, list_id, mc_api_key, mc_server, send_mode='serial', send_opts=None, sync_state_path='',
+                  journal_file='', dead_letter_file='', targets=None):
+    """Sends the contacts to mailchimp with the chosen sender.
+
+    Args:
+        df_final ([dataframe]): Contacts in the format returned by pf.process_to_mailchimp().
+        list_id ([str]): List_id of the list within mailchimp where new entries shall be made.
+        mc_api_key ([str]): Mailchimp API Key. Needed for communication.
+        mc_server ([str]): Mailchimp Server, first part of the URL one logged in. Needed for communication
+        send_mode (str, optional): How contacts are sent to mailchimp. 'serial' sends one request per call,
+            'bulk' uses the batch endpoints of mailchimp, 'concurrent' sends with several requests in flight.
+            Defaults to 'serial'.
+        send_opts (dict, optional): Additional keyword arguments for the chosen sender, e.g. host. Defaults to None.
+        sync_state_path (str, optional): Path of the local sync state store. If given, only contacts that are new or
+            changed since the last run are sent. Defaults to ''.
+        journal_file (str, optional): Path of the send journal. If given, contacts are journaled right after they
+            were sent and contacts already in the journal are skipped. Defaults to ''.
+        dead_letter_file (str, optional): Path of the csv file where contacts that could not be sent are written to,
+            together with their error message. Defaults to ''.
+        targets (list, optional): Targets from tg.read_targets(), the contacts are sent to all of them instead of
+            list_id, see send_to_targets(). Defaults to None.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all contacts that could not be sent.
+    """
+    if targets:
+        return send_to_targets(df_final, targets, send_mode, send_opts, sync_state_path, journal_file,
+                               dead_letter_file)
+    if journal_file:
+        # the slices of the journal share one client, circuit breaker and audience
+        slice_send_opts = pf.share_client(list_id, mc_api_key, mc_server, send_mode, send_opts)
+        errors = sj.send_with_journal(lambda df_batch: send_contacts(df_batch, list_id, mc_api_key, mc_server,
+                                                                     send_mode, slice_send_opts, sync_state_path),
+                                      df_final, journal_file)
+    elif sync_state_path:
+        errors = pf.send_changed_entries(df_final, list_id, mc_api_key, mc_server, send_mode, sync_state_path,
+                                         **(send_opts or {}))
+    else:
+        send_entries = pf.get_sender(send_mode)
+        errors = send_entries(df_final, list_id, mc_api_key, mc_server, **(send_opts or {}))
+    if dead_letter_file:
+        rs.write_dead_letter(df_final, errors, dead_letter_file)
+
+    return errors
+
+
+def send_to_targets(df_final, targets, send_mode='serial', send_opts=None, sync_state_path='', journal_file='',
+                    dead_letter_file=''):
+    """Sends the same contacts to several mailchimp audiences at once, one thread per target. Every target has its
+        own rate limit, journal and dead letter file in a subfolder named like the target, and is timed as stage
+        'send/<target name>' of the run report.
+
+    Args:
+        targets ([list]): Targets from tg.read_targets().
+        For all other arguments see send_contacts().
+
+    Returns:
+        [dict]: Mapping of mail address to the error messages of all targets the contact could not be sent to.
+    """
+    def send_to_target(target):
+        target_journal_file = tg.get_target_path(journal_file, target) if journal_file else ''
+        target_dead_letter_file = tg.get_target_path(dead_letter_file, target) if dead_letter_file else ''
+        with mt.METRICS.stage(f'send/{target.name}', len(df_final)) as stage:
+            target_errors = send_contacts(df_final, target.list_id, target.mc_api_key, target.mc_server, send_mode,
+                                          tg.get_target_send_opts(send_opts, target, send_mode), sync_state_path,
+                                          target_journal_file, target_dead_letter_file)
+            stage['rows_out'] = len(df_final) - len(target_errors)
+        logger.info("Target %s: sent %d of %d contacts to list %s.", target.name, len(df_final) - len(target_errors),
+                    len(df_final), target.list_id)
+        return target_errors
+
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix='target') as executor:
+        results = list(executor.map(send_to_target, targets))
+    errors = {}
+    for target, target_errors in zip(targets, results):
+        for mail_addr, error in target_errors.items():
+            error = rs.join_errors([error], f"{target.name}: ")
+            errors[mail_addr] = rs.join_errors([errors[mail_addr], error]) if mail_addr in errors else error
+
+    return errors
+
 
 def process_file(col_map_for_chimp, cols_for_chimp, data_path, file, ts, list_id, mc_api_key, mc_server, 
-                mode, processed_suffix, what_file=''):
+                mode, processed_suffix, what_file='', send_mode='serial', send_opts=None,
+                sync_state_path='', chunksize=0, typed_load=False, csv_engine=None, journal_path='',
+                dead_letter_path='', dry_run=False, targets=None, archive_index_path=''):
     """Function to combine ETL steps into one procedure.
 
     Args:
@@ -17,40 +158,345 @@ def process_file(col_map_for_chimp, cols_for_chimp, data_path, file, ts, list_id
         mc_server ([type]): Mailchimp Server, first part of the URL one logged in. Needed for communication
         mode ([type]): Shall debugging take place or not? For debugging enter "DEBUG" in the .env file as MODE.
         processed_suffix ([type]): Suffix of the output file which can be manually read in by mailchimp.
-        what_file (str, optional): Is this a file from FundraisingBox or from Twingle? Defaults to ''.
+        what_file (str, optional): Source key of the platform the file is from, e.g. 'is_twingle'. Defaults to ''.
+        send_mode (str, optional): How contacts are sent to mailchimp, see send_contacts(). Defaults to 'serial'.
+        send_opts (dict, optional): Additional keyword arguments for the chosen sender, e.g. host. Defaults to None.
+        sync_state_path (str, optional): Path of the local sync state store. If given, only contacts that are new or
+            changed since the last run are sent. Defaults to ''.
+        chunksize (int, optional): If greater than 0, the file is streamed in chunks of this many rows, so that
+            the memory needed is bounded by the number of unique mail addresses. Defaults to 0.
+        typed_load (bool, optional): Read only the used columns with the dtypes from src/schemas.py. Defaults to False.
+        csv_engine (str, optional): Parser engine for the csv files, e.g. 'pyarrow'. Defaults to None.
+        journal_path (str, optional): Folder of the send journals. If given, a rerun skips contacts that were
+            already sent and the file is only archived once all its contacts were sent. Defaults to ''.
+        dead_letter_path (str, optional): Folder where contacts that could not be sent are written to. Defaults to ''.
+        dry_run (bool, optional): The contacts are sent to the local stand-in server, so the file is not archived.
+            Defaults to False.
+        targets (list, optional): Targets from tg.read_targets(), the contacts are sent to all of them instead of
+            list_id. Defaults to None.
+        archive_index_path (str, optional): Path of the archive index. If given, the archived files and the contacts
+            that were sent are recorded in it. Defaults to ''.
+    """
+    # ETL steps
+    file_processed, df_final = prepare_file(col_map_for_chimp, cols_for_chimp, data_path, file, mode,
+                                            processed_suffix, what_file, chunksize, typed_load, csv_engine)
+
+    # send contacts to mailchimp
+    journal_file = sj.get_journal_file(journal_path, [file], data_path) if journal_path else ''
+    dead_letter_file = rs.get_dead_letter_file(dead_letter_path, file, ts) if dead_letter_path else ''
+    send_and_clean_up(df_final, file, file_processed, ts, data_path, list_id, mc_api_key, mc_server, send_mode,
+                      send_opts, sync_state_path, journal_file, dead_letter_file, not dry_run, targets,
+                      archive_index_path)
+
+
+def is_sent_completely(journal_file, targets=None):
+    """Returns True if the journal, or with targets the journals of all targets, show that all contacts were sent."""
+    if targets:
+        return all(sj.is_complete(tg.get_target_path(journal_file, target)) for target in targets)
+
+    return sj.is_complete(journal_file)
+
+
+def clean_up_if_complete(file, file_processed, ts, data_path, journal_file='', targets=None):
+    """Archives the file and its processed file, but only if its journal shows that all contacts were sent.
+
+    Args:
+        For all arguments see process_file(). Without journal_file the files are always archived.
+
+    Returns:
+        [bool]: True if the files were archived.
+    """
+    if journal_file and not is_sent_completely(journal_file, targets):
+        logger.warning("Not all contacts of %s were sent, it is kept for the next run.", file)
+        return False
+    pf.clean_up(file, file_processed, ts, data_path)
+
+    return True
+
+
+def prepare_file(col_map_for_chimp, cols_for_chimp, data_path, file, mode, processed_suffix, what_file='',
+                 chunksize=0, typed_load=False, csv_engine=None):
+    """Runs all ETL steps of one file that do not need mailchimp and writes the processed file.
+        Runs in a worker process when files are processed in parallel.
+
+    Args:
+        For all arguments see process_file().
+
+    Returns:
+        [tuple]: Name of the processed file and the contacts in the format returned by pf.process_to_mailchimp().
     """
-    # define processed filename
     file_processed = file[:-4] + processed_suffix + '.csv'
+    df_agg = load_and_aggregate(cols_for_chimp, data_path, file, mode, what_file, chunksize, typed_load, csv_engine)
+    with mt.METRICS.stage('tags', len(df_agg)) as stage:
+        df_agg = pf.add_spender_tags(df_agg, mode)
+        stage['rows_out'] = len(df_agg)
+    with mt.METRICS.stage('write', len(df_agg)) as stage:
+        df_final = pf.process_to_mailchimp(df_agg, col_map_for_chimp, file_processed, mode)
+        stage['rows_out'] = len(df_final)
 
-    # ETL steps
-    df_file = hf.load_file(file, data_path, ';')
-    if what_file == 'is_FundraisingBox':
-        df_clean = pf.from_fundraisingbox(df_file, mode)
-    if what_file == 'is_twingle':    
-        df_clean = pf.from_twingle(df_file, mode)
-    df_agg = pf.process_to_one_mailadress(df_clean, cols_for_chimp, mode)
-    df_final = pf.process_to_mailchimp(df_agg, col_map_for_chimp, file_processed, mode)
+    return file_processed, df_final
+
+
+def send_and_clean_up(df_final, file, file_processed, ts, data_path, list_id, mc_api_key, mc_server,
+                      send_mode='serial', send_opts=None, sync_state_path='', journal_file='', dead_letter_file='',
+                      archive=True, targets=None, archive_index_path=''):
+    """Sends the contacts of one file and archives it, both timed as stages of the run.
+
+    Args:
+        archive (bool, optional): Archive the file after sending, False keeps it in the data folder. Defaults to True.
+        For all other arguments see process_file(), send_contacts() and clean_up_if_complete().
+    """
+    with mt.METRICS.stage('send', len(df_final)) as stage:
+        errors = send_contacts(df_final, list_id, mc_api_key, mc_server, send_mode, send_opts, sync_state_path,
+                               journal_file, dead_letter_file, targets)
+        stage['rows_out'] = len(df_final) - len(errors)
+    if not archive:
+        logger.info("Dry run, %s is not archived.", file)
+        return
+    with mt.METRICS.stage('clean_up'):
+        if clean_up_if_complete(file, file_processed, ts, data_path, journal_file, targets) and archive_index_path:
+            ai.record_run(archive_index_path, [file, file_processed], ts, df_final, file_processed, errors, data_path)
+
+
+def process_files_parallel(col_map_for_chimp, cols_for_chimp, data_path, files, ts, list_id, mc_api_key, mc_server,
+                           mode, processed_suffix, send_mode='serial', send_opts=None, sync_state_path='',
+                           chunksize=0, typed_load=False, csv_engine=None, workers=2, journal_path='',
+                           dead_letter_path='', dry_run=False, targets=None, archive_index_path=''):
+    """Parses and transforms the files in a process pool while the contacts of finished files are sent.
+        The contacts are sent by this process only, one file after another in the given order. Each file is
+        archived right after its contacts were sent, so archiving follows the same order in every run.
+
+    Args:
+        files ([list]): Tuples of file name and source key, e.g. ('twingle_2021.csv', 'is_twingle').
+        workers (int, optional): Number of worker processes. Defaults to 2.
+        For all other arguments see process_file().
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=ds.configure,
+                             initargs=ds.WRITER.settings()) as executor:
+        # the metrics of the workers are collected with the results and merged into the metrics of this run
+        futures = [executor.submit(mt.collect, prepare_file, col_map_for_chimp, cols_for_chimp, data_path, file,
+                                   mode, processed_suffix, what_file, chunksize, typed_load, csv_engine)
+                   for file, what_file in files]
+        for (file, what_file), future in zip(files, futures):
+            (file_processed, df_final), worker_metrics = future.result()
+            mt.METRICS.merge(worker_metrics)
+            logger.info("Sending contacts of file %s ...", file)
+            journal_file = sj.get_journal_file(journal_path, [file], data_path) if journal_path else ''
+            dead_letter_file = rs.get_dead_letter_file(dead_letter_path, file, ts) if dead_letter_path else ''
+            send_and_clean_up(df_final, file, file_processed, ts, data_path, list_id, mc_api_key, mc_server,
+                              send_mode, send_opts, sync_state_path, journal_file, dead_letter_file, not dry_run,
+                              targets, archive_index_path)
+
+
+def process_files_combined(col_map_for_chimp, cols_for_chimp, data_path, files, ts, list_id, mc_api_key, mc_server,
+                           mode, processed_suffix, send_mode='serial', send_opts=None, sync_state_path='',
+                           chunksize=0, typed_load=False, csv_engine=None, workers=0, journal_path='',
+                           dead_letter_path='', dry_run=False, targets=None, archive_index_path=''):
+    """Processes all files of all sources together and sends every mail address only once.
+        The files are aggregated one after another in the order of their modification time. If a mail address
+        occurs in several files, the data from the newest file wins and the donor tags of all files are merged.
+
+    Args:
+        col_map_for_chimp ([list]): Mapping of column renames for a mailchimp-readable output file.
+        cols_for_chimp ([list]): Columns names of cols to be used from the transformded input file.
+        data_path ([str]): Path to the csv files.
+        files ([list]): Tuples of file name and source key, e.g. ('twingle_2021.csv', 'is_twingle').
+        ts ([str]): Timestamp of the run, used for the archive folder and the name of the processed file.
+        workers (int, optional): If greater than 1, the files are aggregated in a process pool. Defaults to 0.
+        For all other arguments see process_file().
+    """
+    if not files:
+        return
+    file_processed = 'combined_' + ts + processed_suffix + '.csv'
+    files = sorted(files, key=lambda file_info: os.path.getmtime(data_path + file_info[0]))
+
+    # ETL steps, the rank of the file decides which data is the latest
+    load_args = [(cols_for_chimp, data_path, file, mode, what_file, chunksize, typed_load, csv_engine)
+                 for file, what_file in files]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=ds.configure,
+                                 initargs=ds.WRITER.settings()) as executor:
+            results = list(executor.map(mt.collect, repeat(load_and_aggregate), *zip(*load_args)))
+        for df_file_agg, worker_metrics in results:
+            mt.METRICS.merge(worker_metrics)
+        file_aggs = [df_file_agg for df_file_agg, worker_metrics in results]
+    else:
+        file_aggs = (load_and_aggregate(*args) for args in load_args)
+    df_agg = None
+    for file_rank, df_file_agg in enumerate(file_aggs):
+        df_file_agg['file_rank'] = file_rank
+        with mt.METRICS.stage('dedupe', len(df_file_agg)):
+            df_agg = pf.combine_aggregates(df_agg, df_file_agg, order_by=('file_rank', 'donation_id_max'))
+    with mt.METRICS.stage('tags', len(df_agg)) as stage:
+        df_agg = pf.add_spender_tags(df_agg.drop(columns='file_rank'), mode)
+        stage['rows_out'] = len(df_agg)
+    logger.info("Combined %d files into %d mail addresses.", len(files), len(df_agg))
+    with mt.METRICS.stage('write', len(df_agg)) as stage:
+        df_final = pf.process_to_mailchimp(df_agg, col_map_for_chimp, file_processed, mode)
+        stage['rows_out'] = len(df_final)
 
     # send contacts to mailchimp
-    pf.send_entries_to_mailchimp(df_final, list_id, mc_api_key, mc_server)
+    fnames = [file for file, what_file in files]
+    journal_file = sj.get_journal_file(journal_path, fnames, data_path) if journal_path else ''
+    dead_letter_file = rs.get_dead_letter_file(dead_letter_path, 'combined', ts) if dead_letter_path else ''
+    with mt.METRICS.stage('send', len(df_final)) as stage:
+        errors = send_contacts(df_final, list_id, mc_api_key, mc_server, send_mode, send_opts, sync_state_path,
+                               journal_file, dead_letter_file, targets)
+        stage['rows_out'] = len(df_final) - len(errors)
 
     # Clean up
-    pf.clean_up(file, file_processed, ts, data_path)
+    if dry_run:
+        logger.info("Dry run, the files are not archived.")
+        return
+    if journal_file and not is_sent_completely(journal_file, targets):
+        logger.warning("Not all contacts were sent, the files are kept for the next run.")
+        return
+    with mt.METRICS.stage('clean_up'):
+        pf.archive_files(fnames + [file_processed], ts, data_path)
+        if archive_index_path:
+            ai.record_run(archive_index_path, fnames + [file_processed], ts, df_final, file_processed, errors,
+                          data_path)
 
 
+def watch_files(col_map_for_chimp, cols_for_chimp, data_path, list_id, mc_api_key, mc_server, mode, processed_suffix,
+                sources, send_mode='serial', send_opts=None, sync_state_path='', chunksize=0, typed_load=False,
+                csv_engine=None, journal_path='', dead_letter_path='', dry_run=False, poll_interval=1.0,
+                settle_seconds=2.0, stop_event=None, on_file_done=None, targets=None, archive_index_path=''):
+    """Processes the exports one by one as they arrive in the data folder, until stop_event is set.
+        The session of the mailchimp client is reused for all files, so that the contacts of a new file are sent
+        without opening new connections. With prefetch the members of the list are loaded again for every file,
+        as contacts can subscribe through other channels while the watch runs.
+
+    Args:
+        sources ([list]): Tuples of the substring in the file name and the source, e.g. ('twingle', 'is_twingle').
+        poll_interval (float, optional): Seconds between two checks of the data folder. Defaults to 1.0.
+        settle_seconds (float, optional): Seconds a file must stay unchanged before it is read. Defaults to 2.0.
+        stop_event (Event, optional): Stops the watch once it is set. Defaults to None, i.e. watch forever.
+        on_file_done (function, optional): Called without arguments after each file. Defaults to None.
+        For all other arguments see process_file(), every file is archived into a time folder of its own.
+    """
+    send_opts = dict(send_opts or {})
+    send_opts['session'] = hf.get_session(send_opts.get('max_workers', 1))
+
+    def match(fname):
+        return processed_suffix not in fname and any(substr in fname for substr, what_file in sources)
+
+    def handle_file(file):
+        what_file = next(what_file for substr, what_file in sources if substr in file)
+        logger.info("Processing file %s ...", file)
+        start = time.perf_counter()
+        try:
+            process_file(col_map_for_chimp, cols_for_chimp, data_path, file, hf.get_timestamp(), list_id, mc_api_key,
+                         mc_server, mode, processed_suffix, what_file, send_mode, send_opts, sync_state_path,
+                         chunksize, typed_load, csv_engine, journal_path, dead_letter_path, dry_run, targets,
+                         archive_index_path)
+            logger.info("File %s processed in %.1fs.", file, time.perf_counter() - start)
+        finally:
+            if on_file_done is not None:
+                on_file_done()
+
+    wt.watch(data_path, match, handle_file, poll_interval, settle_seconds, stop_event)
+
+
+def replay_contacts(archive_index_path, ts, list_id, mc_api_key, mc_server, since='', until='', mail_addrs=None,
+                    send_mode='serial', send_opts=None, sync_state_path='', dead_letter_path='', targets=None):
+    """Sends the contacts of the archived runs in the given period again, from the archive index instead of the
+        exports. The newest row of every contact in the period is sent, e.g. to backfill a new list.
+
+    Args:
+        archive_index_path ([str]): Path of the archive index.
+        since (str, optional): ISO date or time of the first run that is replayed. Defaults to '', i.e. all runs.
+        until (str, optional): ISO date or time of the first run that is no longer replayed. Defaults to '',
+            i.e. up to the last run.
+        mail_addrs ([list], optional): Replay only these contacts. Defaults to None, i.e. all contacts.
+        For all other arguments see send_contacts().
+    """
+    conn = ai.open_index(archive_index_path)
+    try:
+        with mt.METRICS.stage('replay_load') as stage:
+            df_final = ai.load_contacts(conn, since, until, mail_addrs)
+            stage['rows_out'] = len(df_final)
+    finally:
+        conn.close()
+    logger.info("Replay: %d contacts from the runs from %s until %s.", len(df_final), since or 'the first run',
+                until or 'the last run')
+    if df_final.empty:
+        return
+    dead_letter_file = rs.get_dead_letter_file(dead_letter_path, 'replay', ts) if dead_letter_path else ''
+    with mt.METRICS.stage('send', len(df_final)) as stage:
+        errors = send_contacts(df_final, list_id, mc_api_key, mc_server, send_mode, send_opts, sync_state_path,
+                               '', dead_letter_file, targets)
+        stage['rows_out'] = len(df_final) - len(errors)
+
+
+def write_run_report(metrics_path, ts, metrics_formats):
+    if metrics_path:
+        for report_file in mt.write_report(mt.METRICS, metrics_path, ts, metrics_formats):
+            logger.info("Run report written to %s.", report_file)
+
 
 def main():
     # read parameters
     env = Env()
     env.read_env()
 
-    # export parameters
-    mc_api_key = env("MAILCHIMP_API_KEY") 
-    mc_server = env("SERVER") 
-    list_id = env("LIST_ID")
+    # export parameters, a dry run needs no mailchimp account
+    dry_run = env.bool("DRY_RUN", False)
+    # with targets every target has an account and a list of its own
+    targets = tg.read_targets(env, env.list("MAILCHIMP_TARGETS", []), dry_run)
+    if dry_run or targets:
+        mc_api_key = env("MAILCHIMP_API_KEY", "dry-run-us1")
+        mc_server = env("SERVER", "us1")
+        list_id = env("LIST_ID", "dry-run")
+    else:
+        mc_api_key = env("MAILCHIMP_API_KEY")
+        mc_server = env("SERVER")
+        list_id = env("LIST_ID")
     mode = env("MODE")
-    parse_fund=env("PARSE_FUND")
-    parse_twing=env("PARSE_TWNIG")
+    # platforms from src/sources.py that are processed, e.g. PARSE_TWNIG = "True"
+    parse_sources = [what_file for what_file, source in sr.SOURCES.items() if env(source.parse_env, "False") == "True"]
+    send_mode = env("SEND_MODE", "serial")
+    mc_host = env("MAILCHIMP_HOST", "")
+    max_connections = env.int("MAX_CONNECTIONS", 10)
+    rate_limit = env.float("RATE_LIMIT", 10.0)
+    if rate_limit <= 0:
+        raise ValueError(f"RATE_LIMIT must be greater than 0, got {rate_limit}.")
+    sync_state_path = env("SYNC_STATE_PATH", "")
+    prefetch_audience = env.bool("PREFETCH_AUDIENCE", False)
+    chunksize = env.int("CHUNKSIZE", 0)
+    typed_load = env.bool("TYPED_LOAD", False)
+    csv_engine = env("CSV_ENGINE", "") or None
+    combine_files = env.bool("COMBINE_FILES", False)
+    parallel_workers = env.int("PARALLEL_WORKERS", 0)
+    journal_path = env("JOURNAL_PATH", "")
+    max_retries = env.int("MAX_RETRIES", rs.MAX_RETRIES)
+    dead_letter_path = env("DEAD_LETTER_PATH", "")
+    metrics_path = env("METRICS_PATH", "./data/metrics/")
+    metrics_formats = env.list("METRICS_FORMAT", ["json"])
+    log_level = env("LOG_LEVEL", "DEBUG" if mode == "DEBUG" else "INFO")
+    log_path = env("LOG_PATH", "./data/logs/")
+    log_mask_emails = env.bool("LOG_MASK_EMAILS", True)
+    watch = env.bool("WATCH", False)
+    watch_poll_interval = env.float("WATCH_POLL_INTERVAL", 1.0)
+    watch_settle_seconds = env.float("WATCH_SETTLE_SECONDS", 2.0)
+    archive_index_path = env("ARCHIVE_INDEX_PATH", ai.DEFAULT_INDEX_PATH)
+    replay = env.bool("REPLAY", False)
+    replay_from = env("REPLAY_FROM", "")
+    replay_to = env("REPLAY_TO", "")
+    replay_emails = env.list("REPLAY_EMAILS", []) or None
+    debug_snapshot_opts = (
+        env("DEBUG_PATH", "debug/"),
+        env("DEBUG_FORMAT", "parquet"),
+        env.int("DEBUG_SAMPLE_ROWS", 0),
+        env.int("DEBUG_QUEUE_SIZE", 4),
+    )
+    dry_run_faults = {
+        'latency': env.float("DRY_RUN_LATENCY", 0.05),
+        'error_rate': env.float("DRY_RUN_ERROR_RATE", 0.0),
+        'throttle_rate': env.float("DRY_RUN_THROTTLE_RATE", 0.0),
+        'max_connections': env.int("DRY_RUN_MAX_CONNECTIONS", 10),
+        'seed': env.int("DRY_RUN_SEED", 0),
+    }
 
     # set defaults
     data_path = './data/'
@@ -66,10 +512,30 @@ def main():
         ('spender_tag', 'Tags'),
     #     ('', 'Birthday'),
     ]
-    fundraising_substr = 'FundraisingBox'
-    twingle_substr = 'twingle'
     processed_suffix = '_processed'
     ts = hf.get_timestamp()
+    log_file = ls.setup_logging(log_level, log_path, ts, log_mask_emails)
+    if log_file:
+        logger.info("Logging to %s", log_file)
+    ds.configure(*debug_snapshot_opts)
+    if dry_run:
+        # only imported for dry runs, the stand-in server is not needed otherwise
+        import src.fake_mailchimp as fm
+
+        fake_server, mc_host = fm.start_server(**dry_run_faults)
+        sync_state_path = journal_path = ''
+        logger.info("Dry run: contacts are sent to the local stand-in server %s, sync state and journal are off, "
+                    "no file is archived.", mc_host)
+    if targets:
+        logger.info("Sending to %d targets: %s.", len(targets), ', '.join(target.name for target in targets))
+    send_opts = {}
+    if mc_host:
+        send_opts['host'] = mc_host
+    if send_mode == 'concurrent':
+        send_opts.update({'max_workers': max_connections, 'rate_limit': rate_limit})
+    if prefetch_audience and send_mode in ('serial', 'concurrent'):
+        send_opts['prefetch'] = True
+    send_opts['max_retries'] = max_retries
 
     # delete processed files
     """ If a run failes, files with the suffix _processed can remain. They cause errors in reruns.
@@ -77,26 +543,73 @@ def main():
     hf.delete_files_containing(processed_suffix, data_path)
     
     # get filenames
-    fundraising_files = hf.get_filenames_containing(fundraising_substr, data_path)
-    twingle_files = hf.get_filenames_containing(twingle_substr, data_path)
-    
-    # process FundraisingBox files
-    if parse_fund == "True":
-        print(f"Process csv files from FundraisingBox ...")
-        for fundraising_file in fundraising_files:
-            print(f"Processing file {fundraising_file} ...")
-            process_file(col_map_for_chimp, cols_for_chimp, data_path, fundraising_file, ts, list_id, mc_api_key,
-                        mc_server,mode, processed_suffix, 'is_FundraisingBox')
-
-    # process twingle files
-    if parse_twing == "True":
-        print(f"Process csv files from twingle ...")
-        for twingle_file in twingle_files:
-            print(f"Processing file {twingle_file} ...")
-            process_file(col_map_for_chimp, cols_for_chimp, data_path, twingle_file, ts, list_id, mc_api_key,
-                        mc_server,mode, processed_suffix, 'is_twingle')
-
-    print('Done')
+    files = []
+    for what_file in parse_sources:
+        source_files = hf.get_filenames_containing(sr.get_source(what_file).file_pattern, data_path)
+        files += [(source_file, what_file) for source_file in sorted(source_files)]
+
+    # send archived contacts again, the files in the data folder are left alone
+    if replay:
+        if not archive_index_path:
+            raise ValueError("REPLAY needs the archive index, set ARCHIVE_INDEX_PATH.")
+        replay_contacts(archive_index_path, ts, list_id, mc_api_key, mc_server, replay_from, replay_to, replay_emails,
+                        send_mode, send_opts, sync_state_path, dead_letter_path, targets)
+    # process the files as they arrive, until the process is stopped
+    elif watch:
+        if combine_files or parallel_workers > 1:
+            logger.info("COMBINE_FILES and PARALLEL_WORKERS are not used in watch mode, the files are processed "
+                        "one by one.")
+        sources = [(sr.get_source(what_file).file_pattern, what_file) for what_file in parse_sources]
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        try:
+            watch_files(col_map_for_chimp, cols_for_chimp, data_path, list_id, mc_api_key, mc_server, mode,
+                        processed_suffix, sources, send_mode, send_opts, sync_state_path, chunksize, typed_load,
+                        csv_engine, journal_path, dead_letter_path, dry_run, watch_poll_interval,
+                        watch_settle_seconds, stop_event, lambda: write_run_report(metrics_path, ts, metrics_formats),
+                        targets, archive_index_path)
+        except KeyboardInterrupt:
+            pass
+        logger.info("Watch stopped.")
+    # process all files together
+    elif combine_files:
+        logger.info("Process %d csv files combined ...", len(files))
+        process_files_combined(col_map_for_chimp, cols_for_chimp, data_path, files, ts, list_id, mc_api_key,
+                               mc_server, mode, processed_suffix, send_mode, send_opts, sync_state_path,
+                               chunksize, typed_load, csv_engine, parallel_workers, journal_path,
+                               dead_letter_path, dry_run, targets, archive_index_path)
+    # process the files in parallel, sending stays in this process
+    elif parallel_workers > 1:
+        logger.info("Process %d csv files with %d worker processes ...", len(files), parallel_workers)
+        process_files_parallel(col_map_for_chimp, cols_for_chimp, data_path, files, ts, list_id, mc_api_key,
+                               mc_server, mode, processed_suffix, send_mode, send_opts, sync_state_path,
+                               chunksize, typed_load, csv_engine, parallel_workers, journal_path,
+                               dead_letter_path, dry_run, targets, archive_index_path)
+    else:
+        # process the files of one platform after another
+        for what_file in parse_sources:
+            logger.info("Process csv files from %s ...", sr.get_source(what_file).name)
+            for source_file in [file for file, file_source in files if file_source == what_file]:
+                logger.info("Processing file %s ...", source_file)
+                process_file(col_map_for_chimp, cols_for_chimp, data_path, source_file, ts, list_id, mc_api_key,
+                            mc_server,mode, processed_suffix, what_file, send_mode, send_opts,
+                            sync_state_path, chunksize, typed_load, csv_engine, journal_path,
+                            dead_letter_path, dry_run, targets, archive_index_path)
+
+    if dry_run:
+        fake_server.shutdown()
+        for dry_run_list_id in [target.list_id for target in targets] or [list_id]:
+            logger.info("Dry run: %d contacts in the stand-in list %s.",
+                        len(fake_server.state.get_list(dry_run_list_id)), dry_run_list_id)
+        logger.info("Dry run: %d requests, injected faults: %s.", fake_server.state.requests, fake_server.state.faults)
+
+    # wait for the debug snapshots that are still written in the background
+    ds.WRITER.flush()
+
+    # write run report
+    write_run_report(metrics_path, ts, metrics_formats)
+
+    logger.info('Done')
 
 
 
@@ -0,0 +1,220 @@
+"""Index of the archived runs.
+
+Every file that is archived into data/processed/<timestamp>/ is recorded with its content hash, and every contact
+that was sent with the row that was sent, so that runs can be looked up by donor and contacts can be replayed
+without parsing the archived exports again.
+
+Look up the runs of a donor or index archive folders from before the index existed, from the repository root:
+    python -m src.archive_index find jane@example.org
+    python -m src.archive_index reindex
+"""
+import argparse
+import ast
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from . import helper_functions as hf
+from . import send_journal as sj
+
+DEFAULT_INDEX_PATH = './data/archive_index.sqlite'
+
+logger = logging.getLogger(__name__)
+
+
+def open_index(index_path=DEFAULT_INDEX_PATH):
+    """Opens the archive index and creates its tables if needed.
+
+    Args:
+        index_path (str, optional): Path of the SQLite file. Defaults to DEFAULT_INDEX_PATH.
+
+    Returns:
+        [Connection]: Connection to the archive index.
+    """
+    conn = sqlite3.connect(index_path)
+    conn.execute("""CREATE TABLE IF NOT EXISTS archived_files (
+                        run_ts TEXT NOT NULL,
+                        fname TEXT NOT NULL,
+                        file_hash TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        archived_at TEXT NOT NULL,
+                        PRIMARY KEY (run_ts, fname))""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS archived_contacts (
+                        run_ts TEXT NOT NULL,
+                        fname TEXT NOT NULL,
+                        subscriber_hash TEXT NOT NULL,
+                        email_address TEXT NOT NULL,
+                        archived_at TEXT NOT NULL,
+                        record TEXT NOT NULL,
+                        PRIMARY KEY (run_ts, fname, subscriber_hash))""")
+    conn.execute("CREATE INDEX IF NOT EXISTS contacts_by_hash ON archived_contacts (subscriber_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS contacts_by_time ON archived_contacts (archived_at)")
+    conn.commit()
+
+    return conn
+
+
+def record_files(conn, fnames, run_ts, data_path='./data/', folder_name='processed'):
+    """Stores name, content hash and size of archived files.
+
+    Args:
+        conn ([Connection]): Connection to the archive index.
+        fnames ([list]): Names of the files within the time folder.
+        run_ts ([str]): Timestamp of the run, the name of the time folder.
+        data_path (str, optional): Path to the data folder. Defaults to './data/'.
+        folder_name (str, optional): Name of the archive folder within the data folder. Defaults to 'processed'.
+    """
+    archived_at = datetime.now().isoformat(timespec='seconds')
+    rows = []
+    for fname in fnames:
+        fpath = os.path.join(data_path, folder_name, run_ts, fname)
+        rows.append((run_ts, fname, sj.get_file_hash(fpath), os.path.getsize(fpath), archived_at))
+    conn.executemany("INSERT OR REPLACE INTO archived_files (run_ts, fname, file_hash, size, archived_at) "
+                     "VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def record_contacts(conn, df_final, run_ts, fname, errors=None):
+    """Stores the rows of all contacts that were sent without errors.
+
+    Args:
+        conn ([Connection]): Connection to the archive index.
+        df_final ([dataframe]): Contacts in the format returned by pf.process_to_mailchimp(), mail address first.
+        run_ts ([str]): Timestamp of the run, the name of the time folder.
+        fname ([str]): Name of the processed file the contacts were written to.
+        errors ([dict], optional): Mapping of mail address to error message of contacts that failed.
+            Defaults to None.
+    """
+    errors = errors or {}
+    archived_at = datetime.now().isoformat(timespec='seconds')
+    mail_hashes = hf.get_subscriber_hashes(df_final)
+    columns = [str(col) for col in df_final.columns]
+    rows = [(run_ts, fname, mail_hashes[values[0]], values[0], archived_at,
+             json.dumps(dict(zip(columns, values)), default=str))
+            for values in df_final.itertuples(index=False, name=None) if values[0] not in errors]
+    conn.executemany("INSERT OR REPLACE INTO archived_contacts "
+                     "(run_ts, fname, subscriber_hash, email_address, archived_at, record) VALUES (?, ?, ?, ?, ?, ?)",
+                     rows)
+    conn.commit()
+    logger.info("Archive index: %d contacts of %s recorded for run %s.", len(rows), fname, run_ts)
+
+
+def record_run(index_path, fnames, run_ts, df_final, fname_processed, errors=None, data_path='./data/'):
+    """Records the archived files and the contacts sent from them, called right after the files were archived.
+
+    Args:
+        index_path ([str]): Path of the SQLite file.
+        For all other arguments see record_files() and record_contacts().
+    """
+    conn = open_index(index_path)
+    try:
+        record_files(conn, fnames, run_ts, data_path)
+        record_contacts(conn, df_final, run_ts, fname_processed, errors)
+    finally:
+        conn.close()
+
+
+def load_contacts(conn, since='', until='', mail_addrs=None):
+    """Loads the contacts that were sent in the given period, the newest row per contact.
+
+    Args:
+        conn ([Connection]): Connection to the archive index.
+        since (str, optional): ISO date or time, e.g. '2026-01-01', of the first run that is included.
+            Defaults to '', i.e. from the first run.
+        until (str, optional): ISO date or time of the first run that is no longer included. Defaults to '',
+            i.e. up to the last run.
+        mail_addrs ([list], optional): Load only these contacts. Defaults to None, i.e. all contacts.
+
+    Returns:
+        [dataframe]: Contacts in the format returned by pf.process_to_mailchimp(), indexed by subscriber hash.
+    """
+    query = "SELECT subscriber_hash, record FROM archived_contacts WHERE archived_at >= ?"
+    params = [since]
+    if until:
+        query += " AND archived_at < ?"
+        params.append(until)
+    if mail_addrs is not None:
+        subscriber_hashes = hf.hash_strings(pd.Series(list(mail_addrs), dtype=object).str.strip()).unique().tolist()
+        query += " AND subscriber_hash IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(subscriber_hashes))
+    # the newest row of a contact wins, like in the combined processing
+    rows = conn.execute(query + " ORDER BY archived_at, run_ts", params).fetchall()
+    records = {subscriber_hash: record for subscriber_hash, record in rows}
+    df_contacts = pd.DataFrame([json.loads(record) for record in records.values()], index=list(records))
+    df_contacts.index.name = 'subscriber_hash'
+
+    return df_contacts
+
+
+def find_runs(conn, mail_addr):
+    """Returns the runs and processed files that contained the mail address.
+
+    Returns:
+        [list]: Tuples of run timestamp, processed file and time the run was archived, oldest first.
+    """
+    subscriber_hash = hf.hash_string(mail_addr.strip())
+
+    return conn.execute("SELECT run_ts, fname, archived_at FROM archived_contacts WHERE subscriber_hash = ? "
+                        "ORDER BY archived_at, run_ts", [subscriber_hash]).fetchall()
+
+
+def read_processed_file(fpath):
+    """Reads an archived processed file back into the format returned by pf.process_to_mailchimp()."""
+    df_contacts = pd.read_csv(fpath, dtype=str, keep_default_na=False)
+    for col in ('Address_dict', 'Tags'):
+        if col in df_contacts.columns:
+            df_contacts[col] = [ast.literal_eval(value) if value else None for value in df_contacts[col]]
+
+    return df_contacts
+
+
+def index_archive(conn, data_path='./data/', folder_name='processed', processed_suffix='_processed'):
+    """Adds the time folders of the archive that are not in the index yet, e.g. runs from before the index
+        existed. The contacts are read from the processed files, all of them count as sent.
+
+    Returns:
+        [int]: Number of time folders that were added.
+    """
+    archive_path = os.path.join(data_path, folder_name)
+    known = {run_ts for run_ts, in conn.execute("SELECT DISTINCT run_ts FROM archived_files")}
+    added = 0
+    for run_ts in sorted(os.listdir(archive_path)):
+        run_path = os.path.join(archive_path, run_ts)
+        if run_ts in known or not os.path.isdir(run_path):
+            continue
+        fnames = sorted(os.listdir(run_path))
+        record_files(conn, fnames, run_ts, data_path, folder_name)
+        for fname in fnames:
+            if processed_suffix in fname and fname.endswith('.csv'):
+                record_contacts(conn, read_processed_file(os.path.join(run_path, fname)), run_ts, fname)
+        added += 1
+
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['find', 'reindex'])
+    parser.add_argument('mail_addrs', nargs='*', help='mail addresses to look up with find')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    parser.add_argument('--data-path', default='./data/')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    conn = open_index(args.index)
+    try:
+        if args.command == 'reindex':
+            print(f"{index_archive(conn, args.data_path)} archive folders added to {args.index}.")
+        for mail_addr in args.mail_addrs:
+            runs = find_runs(conn, mail_addr)
+            print(f"{mail_addr}: {len(runs)} runs")
+            for run_ts, fname, archived_at in runs:
+                print(f"  {run_ts}  {fname}  archived {archived_at}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
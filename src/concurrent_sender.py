@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from . import resilience as rs
+
+# Mailchimp allows at most 10 simultaneous connections per api key
+MAX_CONNECTIONS = 10
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket rate limiter that can be shared between threads.
+
+    Args:
+        rate ([float]): Number of tokens that are added per second, must be greater than 0.
+        capacity ([float], optional): Maximal number of tokens, i.e. the allowed burst. Defaults to rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"The rate limit must be greater than 0, got {rate}.")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Blocks until the given number of tokens is available and takes them from the bucket."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def send_concurrently(entries, send_entry, max_workers=MAX_CONNECTIONS):
+    """Sends entries with a bounded thread pool and reports the throughput.
+
+    Args:
+        entries ([list]): List of tuples (mail address, merge fields, tags).
+        send_entry ([function]): Function that sends one entry and returns a list of error messages.
+        max_workers (int, optional): Maximal number of entries in flight. Defaults to MAX_CONNECTIONS.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all entries that could not be sent.
+    """
+    errors = {}
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, MAX_CONNECTIONS))) as executor:
+        futures = {executor.submit(send_entry, *entry): entry[0] for entry in entries}
+        for future in as_completed(futures):
+            mail_addr = futures[future]
+            try:
+                entry_errors = future.result()
+            except Exception as error:
+                entry_errors = [rs.SendError(str(error))]
+            if entry_errors:
+                errors[mail_addr] = rs.join_errors(entry_errors)
+    duration = time.monotonic() - start
+
+    throughput = len(entries) / duration if duration > 0 else 0.0
+    logger.info("Sent %d of %d entries in %.1fs (%.1f contacts/s).", len(entries) - len(errors), len(entries),
+                duration, throughput)
+
+    return errors
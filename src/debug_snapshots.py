@@ -0,0 +1,127 @@
+import logging
+import os
+import queue
+import threading
+
+# Seconds the writer thread waits for new snapshots before it stops, it is started again by the next snapshot
+IDLE_TIMEOUT = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def to_arrow_table(df_input):
+    """Converts the dataframe column by column into a pyarrow table. Address dicts and tag lists become nested
+        fields, object columns that pyarrow can not convert, e.g. because they mix numbers and strings, are stored
+        as strings. A named index, e.g. the mail address, is stored as first column.
+    """
+    import pyarrow as pa
+
+    if df_input.index.name is not None:
+        df_input = df_input.reset_index()
+    arrays = []
+    for col in df_input.columns:
+        try:
+            arrays.append(pa.array(df_input[col], from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array(df_input[col].astype(str)))
+
+    return pa.Table.from_arrays(arrays, names=[str(col) for col in df_input.columns])
+
+
+def write_snapshot(df_input, dest, ftype='parquet'):
+    """Writes one snapshot, as zstd compressed parquet file or as pickle.
+
+    Returns:
+        [str]: Path of the written file.
+    """
+    if ftype == 'parquet':
+        import pyarrow.parquet as pq
+
+        dest += '.parquet'
+        pq.write_table(to_arrow_table(df_input), dest, compression='zstd')
+    else:
+        dest += '.pkl'
+        df_input.to_pickle(dest)
+
+    return dest
+
+
+class SnapshotWriter:
+    """Writes the debug snapshots of the dataframes in a background thread, so that the pipeline does not wait for
+        the serialization. The queue is bounded: if the writer falls behind, the pipeline waits for a free slot
+        instead of holding more copies of the dataframes in memory.
+
+    Args:
+        path (str, optional): Folder of the snapshots. Defaults to 'debug/'.
+        ftype (str, optional): 'parquet' or 'pkl'. Parquet falls back to pkl if pyarrow is not installed.
+            Defaults to 'parquet'.
+        sample_rows (int, optional): Write a random sample of at most this many rows, 0 writes all rows.
+            Defaults to 0.
+        queue_size (int, optional): Snapshots that can wait for the writer. Defaults to 4.
+    """
+
+    def __init__(self, path='debug/', ftype='parquet', sample_rows=0, queue_size=4):
+        self.path = path
+        self.ftype = ftype
+        self.sample_rows = sample_rows
+        self.queue_size = queue_size
+        self.queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def settings(self):
+        return self.path, self.ftype, self.sample_rows, self.queue_size
+
+    def submit(self, df_input, fname):
+        """Queues a snapshot of the dataframe under the given name, blocks while the queue is full."""
+        if self.sample_rows and len(df_input) > self.sample_rows:
+            df_snapshot = df_input.sample(n=self.sample_rows, random_state=0)
+        else:
+            # the pipeline may change the dataframe in place before it is written
+            df_snapshot = df_input.copy()
+        self.queue.put((df_snapshot, fname))
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='debug-snapshots')
+                self.thread.start()
+
+    def run(self):
+        if self.ftype == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                logger.warning("pyarrow is not installed, debug snapshots are written as pkl.")
+                self.ftype = 'pkl'
+        os.makedirs(self.path, exist_ok=True)
+        while True:
+            try:
+                df_snapshot, fname = self.queue.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                # stop when idle, so that the thread never keeps a process from exiting
+                with self.lock:
+                    if self.queue.empty():
+                        self.thread = None
+                        return
+                continue
+            try:
+                dest = write_snapshot(df_snapshot, os.path.join(self.path, fname), self.ftype)
+                logger.debug("Debug snapshot written to %s (%d rows).", dest, len(df_snapshot))
+            except Exception as e:
+                logger.warning("Debug snapshot %s could not be written: %s", fname, e)
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Blocks until all queued snapshots are written."""
+        self.queue.join()
+
+
+# Writer of this process
+WRITER = SnapshotWriter()
+
+
+def configure(path='debug/', ftype='parquet', sample_rows=0, queue_size=4):
+    """Replaces the writer of this process, e.g. as initializer of worker processes with WRITER.settings()."""
+    global WRITER
+    WRITER.flush()
+    WRITER = SnapshotWriter(path, ftype, sample_rows, queue_size)
@@ -0,0 +1,348 @@
+import argparse
+import io
+import json
+import random
+import re
+import tarfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from . import helper_functions as hf
+
+
+class FakeMailchimpState:
+    """In-memory storage of the local mailchimp stand-in server and the faults it injects.
+
+    Args:
+        latency (float, optional): Seconds every API request is delayed. Defaults to 0.0.
+        error_rate (float, optional): Share of API requests answered with 500. Defaults to 0.0.
+        throttle_rate (float, optional): Share of API requests answered with 429. Defaults to 0.0.
+        max_connections (int, optional): Requests on more simultaneous connections than this are answered with 429
+            like mailchimp does, 0 allows any number. Defaults to 0.
+        retry_after (float, optional): Value of the Retry-After header of the 429 responses. Defaults to 1.0.
+        seed (int, optional): Seed of the random faults, so that runs are reproducible. Defaults to 0.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, throttle_rate=0.0, max_connections=0, retry_after=1.0, seed=0):
+        self.lock = threading.Lock()
+        self.members = {}
+        self.batches = {}
+        self.results = {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_connections = max_connections
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        self.requests = 0
+        self.faults = {}
+
+    def get_list(self, list_id):
+        return self.members.setdefault(list_id, {})
+
+    def draw_fault(self):
+        """Draws whether the next API request fails.
+
+        Returns:
+            [int]: Status code of the injected fault, None if the request is served.
+        """
+        with self.lock:
+            self.requests += 1
+            draw = self.random.random()
+            status_code = None
+            if self.max_connections and self.in_flight > self.max_connections:
+                status_code = 429
+            elif draw < self.throttle_rate:
+                status_code = 429
+            elif draw < self.throttle_rate + self.error_rate:
+                status_code = 500
+            if status_code is not None:
+                self.faults[status_code] = self.faults.get(status_code, 0) + 1
+
+        return status_code
+
+
+def is_valid_mail(mail_addr):
+    """Very simple check of a mail address, rejects everything mailchimp would reject for sure."""
+    return bool(re.match(r'^[^@\s]+@[^@\s]+\.[^@\s]+$', str(mail_addr)))
+
+
+def upsert_member(state, list_id, body, update_existing=True):
+    """Creates or updates one member in the in-memory list.
+
+    Returns:
+        [tuple]: Status code and response body.
+    """
+    mail_addr = body.get('email_address', '')
+    if not is_valid_mail(mail_addr):
+        return 400, {"title": "Invalid Resource", "status": 400,
+                     "detail": f"{mail_addr} looks fake or invalid, please enter a real email address."}
+    mail_h = hf.hash_string(mail_addr)
+    with state.lock:
+        members = state.get_list(list_id)
+        if mail_h in members and not update_existing:
+            return 400, {"title": "Member Exists", "status": 400,
+                         "detail": f"{mail_addr} is already a list member."}
+        member = members.setdefault(mail_h, {"id": mail_h, "email_address": mail_addr, "merge_fields": {},
+                                             "tags": [], "status": body.get('status', 'subscribed')})
+        member['email_address'] = mail_addr
+        member['status'] = body.get('status', member['status'])
+        member['merge_fields'].update(body.get('merge_fields', {}))
+        for tag in body.get('tags', []):
+            if tag not in member['tags']:
+                member['tags'].append(tag)
+
+    return 200, dict(member)
+
+
+def update_member_tags(state, list_id, mail_h, body):
+    """Activates or deactivates tags of one member in the in-memory list.
+
+    Returns:
+        [tuple]: Status code and response body.
+    """
+    with state.lock:
+        member = state.get_list(list_id).get(mail_h)
+        if member is None:
+            return 404, {"title": "Resource Not Found", "status": 404,
+                         "detail": "The requested resource could not be found."}
+        for tag in body.get('tags', []):
+            if tag.get('status') == 'inactive':
+                if tag['name'] in member['tags']:
+                    member['tags'].remove(tag['name'])
+            elif tag['name'] not in member['tags']:
+                member['tags'].append(tag['name'])
+
+    return 204, None
+
+
+def list_members(state, list_id, query):
+    """Implements the paged list members endpoint (GET /lists/{list_id}/members)."""
+    count = int(query.get('count', ['10'])[0])
+    offset = int(query.get('offset', ['0'])[0])
+    with state.lock:
+        members = list(state.get_list(list_id).values())
+        page = [dict(member, tags=[{"id": i, "name": tag} for i, tag in enumerate(member['tags'])])
+                for member in members[offset:offset + count]]
+
+    return {"members": page, "list_id": list_id, "total_items": len(members)}
+
+
+def run_operation(state, operation):
+    """Executes one operation of a batch request.
+
+    Returns:
+        [tuple]: Status code and response body.
+    """
+    body = json.loads(operation.get('body') or '{}')
+    match = re.match(r'^/lists/([^/]+)/members/([^/]+)/tags$', operation.get('path', ''))
+    if operation.get('method') == 'POST' and match:
+        return update_member_tags(state, match.group(1), match.group(2), body)
+
+    return 404, {"title": "Resource Not Found", "status": 404, "detail": "Unsupported batch operation."}
+
+
+def run_batch(state, operations, base_url):
+    """Executes all operations of a batch request and stores the results as gzipped tar archive."""
+    batch_id = uuid.uuid4().hex[:10]
+    results = []
+    errored = 0
+    for operation in operations:
+        status_code, body = run_operation(state, operation)
+        if status_code >= 400:
+            errored += 1
+        results.append({"status_code": status_code, "operation_id": operation.get('operation_id'),
+                        "response": json.dumps(body) if body is not None else ''})
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        content = json.dumps(results).encode()
+        info = tarfile.TarInfo(name=f'{batch_id}.json')
+        info.size = len(content)
+        archive.addfile(info, io.BytesIO(content))
+
+    batch = {"id": batch_id, "status": "finished", "total_operations": len(operations),
+             "finished_operations": len(operations), "errored_operations": errored,
+             "response_body_url": f"{base_url}/_results/{batch_id}.tar.gz"}
+    with state.lock:
+        state.results[batch_id] = buffer.getvalue()
+        state.batches[batch_id] = batch
+
+    return batch
+
+
+def batch_subscribe(state, list_id, body):
+    """Implements the batch subscribe endpoint (POST /lists/{list_id})."""
+    response = {"new_members": [], "updated_members": [], "errors": [],
+                "total_created": 0, "total_updated": 0, "error_count": 0}
+    update_existing = body.get('update_existing', False)
+    for member in body.get('members', []):
+        existed = hf.hash_string(str(member.get('email_address', ''))) in state.get_list(list_id)
+        status_code, result = upsert_member(state, list_id, member, update_existing)
+        if status_code >= 400:
+            response['errors'].append({"email_address": member.get('email_address', ''),
+                                       "error": result['detail'], "error_code": "ERROR_GENERIC"})
+        elif existed:
+            response['updated_members'].append(result)
+        else:
+            response['new_members'].append(result)
+    response['total_created'] = len(response['new_members'])
+    response['total_updated'] = len(response['updated_members'])
+    response['error_count'] = len(response['errors'])
+
+    return response
+
+
+class FakeMailchimpHandler(BaseHTTPRequestHandler):
+    """Request handler that mimics the used parts of the mailchimp marketing API."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code, body, headers=None):
+        content = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_one_request(self):
+        # counts the connections that are open at the same time, for max_connections
+        state = self.server.state
+        with state.lock:
+            state.in_flight += 1
+        try:
+            super().handle_one_request()
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def inject_fault(self):
+        """Delays the API request by the configured latency and answers it with an injected fault if one is drawn.
+
+        Returns:
+            [bool]: True if a fault was sent and the request must not be handled.
+        """
+        state = self.server.state
+        if state.latency:
+            time.sleep(state.latency)
+        status_code = state.draw_fault()
+        if status_code == 429:
+            self.send_json(429, {"title": "Too Many Requests", "status": 429,
+                                 "detail": "You have exceeded the limit of 10 simultaneous connections."},
+                           {'Retry-After': str(state.retry_after)})
+        elif status_code == 500:
+            self.send_json(500, {"title": "Internal Server Error", "status": 500,
+                                 "detail": "An unexpected internal error has occurred."})
+
+        return status_code is not None
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def do_GET(self):
+        state = self.server.state
+        path = self.path.split('?')[0]
+        match = re.match(r'^/_results/([^/]+)\.tar\.gz$', path)
+        if match and match.group(1) in state.results:
+            content = state.results[match.group(1)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/gzip')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        if self.inject_fault():
+            return
+        match = re.match(r'^/3\.0/lists/([^/]+)/members$', path)
+        if match:
+            self.send_json(200, list_members(state, match.group(1), parse_qs(urlparse(self.path).query)))
+            return
+        match = re.match(r'^/3\.0/batches/([^/]+)$', path)
+        if match and match.group(1) in state.batches:
+            self.send_json(200, state.batches[match.group(1)])
+            return
+        self.send_json(404, {"title": "Resource Not Found", "status": 404, "detail": path})
+
+    def do_POST(self):
+        state = self.server.state
+        path = self.path.split('?')[0]
+        body = self.read_body()
+        if self.inject_fault():
+            return
+        if path == '/3.0/batches':
+            self.send_json(200, run_batch(state, body.get('operations', []), self.server.base_url))
+            return
+        match = re.match(r'^/3\.0/lists/([^/]+)$', path)
+        if match:
+            self.send_json(200, batch_subscribe(state, match.group(1), body))
+            return
+        match = re.match(r'^/3\.0/lists/([^/]+)/members$', path)
+        if match:
+            self.send_json(*upsert_member(state, match.group(1), body, update_existing=False))
+            return
+        match = re.match(r'^/3\.0/lists/([^/]+)/members/([^/]+)/tags$', path)
+        if match:
+            self.send_json(*update_member_tags(state, match.group(1), match.group(2), body))
+            return
+        self.send_json(404, {"title": "Resource Not Found", "status": 404, "detail": path})
+
+    def do_PUT(self):
+        state = self.server.state
+        path = self.path.split('?')[0]
+        body = self.read_body()
+        if self.inject_fault():
+            return
+        match = re.match(r'^/3\.0/lists/([^/]+)/members/([^/]+)$', path)
+        if match:
+            self.send_json(*upsert_member(state, match.group(1), body))
+            return
+        self.send_json(404, {"title": "Resource Not Found", "status": 404, "detail": path})
+
+
+def start_server(host='127.0.0.1', port=0, **faults):
+    """Starts the local mailchimp stand-in server in a background thread.
+
+    Args:
+        host (str, optional): Interface to bind to. Defaults to '127.0.0.1'.
+        port (int, optional): Port to bind to, 0 picks a free port. Defaults to 0.
+        **faults: Latency and fault rates of the server, see FakeMailchimpState.
+
+    Returns:
+        [tuple]: The running server and the API base URL that can be given to get_mailchimp_client().
+    """
+    server = ThreadingHTTPServer((host, port), FakeMailchimpHandler)
+    server.daemon_threads = True
+    server.state = FakeMailchimpState(**faults)
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server, server.base_url + '/3.0'
+
+
+if __name__ == "__main__":
+    # run the stand-in server in the foreground, e.g. python -m src.fake_mailchimp 8765 --latency 0.05
+    parser = argparse.ArgumentParser(description="Local stand-in server for the used parts of the mailchimp API.")
+    parser.add_argument('port', type=int, nargs='?', default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--max-connections', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    fake_server, api_url = start_server(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                                        throttle_rate=args.throttle_rate, max_connections=args.max_connections,
+                                        seed=args.seed)
+    print(f"Local mailchimp stand-in server listening on {api_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake_server.shutdown()
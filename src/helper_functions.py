@@ -1,33 +1,60 @@
-import csv
 import json
-import pandas as pd
-import seaborn as sns
-import urllib
-import urllib.request
-import matplotlib.pyplot as plt
 import logging
-import urllib.request
-# import chimpy
-import shutil
 import os
 import hashlib
+import time
 from datetime import datetime
-import mailchimp_marketing as MailchimpMarketing
-from mailchimp_marketing.api_client import ApiClientError
-from environs import Env
+import numpy as np
+import pandas as pd
+from . import resilience as rs
+from . import metrics as mt
+from . import debug_snapshots as ds
+
+logger = logging.getLogger(__name__)
+
+
+def import_mailchimp():
+    """Imports the mailchimp client on first use, so that runs and worker processes that only transform files
+        do not pay for its import.
+
+    Returns:
+        [module]: The mailchimp_marketing module.
+    """
+    import mailchimp_marketing
+
+    return mailchimp_marketing
+
+
+def api_client_error():
+    """Returns the exception class of the mailchimp client, imported on first use. Meant for except clauses,
+        which only evaluate it once an exception occurs.
+    """
+    from mailchimp_marketing.api_client import ApiClientError
 
+    return ApiClientError
 
-def load_file(fname, fpath='./', delimiter=','):
+
+def load_file(fname, fpath='./', delimiter=',', chunksize=None, schema=None, engine=None):
     """Helper function to load files
 
     Args:
         fpath : Path to the csv-files.
         delimiter (str, optional): Delimiter for csv file. for Defaults to ';'.
+        chunksize (int, optional): If given, an iterator over dataframes with at most chunksize rows each
+            is returned instead of one dataframe. Defaults to None.
+        schema (dict, optional): Mapping of column name to dtype, see src/schemas.py. If given, only these
+            columns are read with the given dtypes. Defaults to None.
+        engine (str, optional): Parser engine of pandas, e.g. 'pyarrow'. The pyarrow engine does not support
+            chunks, the default engine is used then. Defaults to None.
     """
 
     dest = fpath + fname
-    print(f"Loading file {dest} ...")
-    df_file = pd.read_csv(dest, delimiter=delimiter)
+    logger.info("Loading file %s ...", dest)
+    if chunksize and engine == 'pyarrow':
+        engine = None
+    usecols = list(schema) if schema else None
+    df_file = pd.read_csv(dest, delimiter=delimiter, chunksize=chunksize, usecols=usecols, dtype=schema,
+                          engine=engine)
 
     return df_file
 
@@ -46,16 +73,17 @@ def write_file(df_input, fname, fpath='./', delimiter=',', index=False, ftype='c
 
     dest = fpath + fname
     if ftype == 'csv':
-        print(f"Writing file {dest} ...")
+        logger.info("Writing file %s ...", dest)
         df_input.to_csv(dest, sep=delimiter, index=index)
     elif ftype == 'pkl':
         dest = dest.replace("csv", "pkl")
-        print(f"Writing file {dest} ...")
+        logger.info("Writing file %s ...", dest)
         df_input.to_pickle(dest)
 
 
 def out_for_debug(df_input, fname, modus=''):
-    """Wrapper for function "write_file". Will only be executed if mode=DEBUG and writes a pkl file to the debug folder.
+    """Writes a snapshot of the dataframe to the debug folder if mode=DEBUG. The snapshot is written in the background
+        by src.debug_snapshots.WRITER, as parquet file by default.
 
     Args:
         df_input ([dateframe]): Dataframe that shall be written into a file for debugging purposes.
@@ -64,11 +92,10 @@ def out_for_debug(df_input, fname, modus=''):
             If MODE is set to DEBUG in the .env file, outputs for debugging are written.
     """
     
-    print(f"modus is: {modus}")
+    logger.debug("modus is: %s", modus)
     if modus == 'DEBUG':
-        fname = fname+'.pkl'
-        print(f"DEBUG: Writing file {fname} to the debug folder ...")
-        write_file(df_input, fname, 'debug/', ftype='pkl')
+        logger.debug("Queueing debug snapshot %s ...", fname)
+        ds.WRITER.submit(df_input, fname)
 
 
 def get_mailchimp_lists(mc_api_key, server):
@@ -79,16 +106,159 @@ def get_mailchimp_lists(mc_api_key, server):
         server ([str]): Shorthand of the used server. The first part of the URL visible in the browser once logged in.
     """
     try:
-        client = MailchimpMarketing.Client()
+        client = import_mailchimp().Client()
         client.set_config({
             "api_key": mc_api_key,
             "server": server
         })
 
         response = client.lists.get_all_lists()
-        print(response)
-    except ApiClientError as error:
-        print("Error: {}".format(error.text))
+        logger.info("%s", response)
+    except api_client_error() as error:
+        logger.error("Error: %s", error.text)
+
+
+def get_mailchimp_client(mc_api_key, server, host='', pool_size=0, rate_limiter=None, retry_policy=None,
+                         circuit_breaker=None, concurrency=None, session=None):
+    """Helper function to create a configured mailchimp client.
+        All requests of the client are retried on throttling (429) and temporary server errors.
+
+    Args:
+        mc_api_key ([str]): Api Key from mailchimp.com. Needed to interact with the API.
+        server ([str]): Shorthand of the used server. The first part of the URL visible in the browser once logged in.
+        host (str, optional): Base URL of the API, e.g. 'http://127.0.0.1:8765/3.0' for a local stand-in server.
+            Defaults to '' which means the official mailchimp API is used.
+        pool_size (int, optional): Number of connections the session of the client keeps open, so the client can be
+            shared between threads. Defaults to 0, which keeps one connection.
+        rate_limiter (optional): Object with an acquire() method that is called before every request. Defaults to None.
+        retry_policy (RetryPolicy, optional): Backoff of failed requests. Defaults to None, i.e. rs.RetryPolicy().
+        circuit_breaker (CircuitBreaker, optional): Pauses the requests if too many fail. Defaults to None.
+        concurrency (AdaptiveConcurrency, optional): Limits the requests in flight. Defaults to None.
+        session (Session, optional): Session from get_session() whose open connections are reused, e.g. by all
+            clients of a long-running process. Defaults to None, which creates a new session.
+
+    Returns:
+        [Client]: Configured client object from mailchimp.
+    """
+    client = import_mailchimp().Client()
+    client.set_config({
+        "api_key": mc_api_key,
+        "server": server
+    })
+    if host:
+        client.api_client.host = host
+    client.api_client.request = make_session_request(client.api_client, max(pool_size, 1), rate_limiter,
+                                                     retry_policy or rs.RetryPolicy(), circuit_breaker, concurrency,
+                                                     session)
+
+    return client
+
+
+def get_session(pool_size=1):
+    """Creates a requests session that keeps up to pool_size connections open.
+
+    Args:
+        pool_size (int, optional): Number of connections kept open. Defaults to 1.
+
+    Returns:
+        [Session]: Session with a pooled adapter for http and https.
+    """
+    # requests comes with the mailchimp client, it is only imported once a client is created
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def make_session_request(api_client, pool_size, rate_limiter=None, retry_policy=None, circuit_breaker=None,
+                         concurrency=None, session=None):
+    """Creates a replacement for ApiClient.request that sends all requests through one pooled session.
+        Requests answered with a status of rs.RETRY_STATUS_CODES or failing with a connection error are retried
+        with exponential backoff, honoring the Retry-After header of the response.
+
+    Args:
+        api_client: ApiClient object of the mailchimp client.
+        pool_size ([int]): Number of connections kept open.
+        rate_limiter (optional): Object with an acquire() method that is called before every request. Defaults to None.
+        retry_policy (RetryPolicy, optional): Backoff of failed requests. Defaults to None, which means no retries.
+        circuit_breaker (CircuitBreaker, optional): Pauses the requests if too many fail. Defaults to None.
+        concurrency (AdaptiveConcurrency, optional): Limits the requests in flight. Defaults to None.
+        session (Session, optional): Session that is used instead of a new one with pool_size connections.
+            Defaults to None.
+
+    Returns:
+        [function]: Function with the signature of ApiClient.request and the additional argument with_credentials,
+            False sends the request without the api key, e.g. to download the results of a batch request.
+    """
+    import requests
+
+    session = session if session is not None else get_session(pool_size)
+    max_retries = retry_policy.max_retries if retry_policy is not None else 0
+
+    def send(method, url, query_params, headers, data, auth):
+        if circuit_breaker is not None:
+            circuit_breaker.before_call()
+        if concurrency is not None:
+            concurrency.acquire()
+        try:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                res = session.request(method, url, params=query_params, data=data, headers=headers, auth=auth,
+                                      timeout=api_client.timeout)
+                outcome = res.status_code
+            except requests.RequestException as err:
+                outcome = type(err).__name__
+                raise
+            finally:
+                mt.METRICS.record_api_call(method, url, outcome, time.perf_counter() - start)
+            return res
+        finally:
+            if concurrency is not None:
+                concurrency.release()
+
+    def request(method, url, query_params=None, headers=None, body=None, with_credentials=True):
+        # with_credentials=False is used for urls outside the api, e.g. the download of batch results
+        auth = None
+        if api_client.is_basic_auth and with_credentials:
+            auth = ('user', api_client.api_key)
+        if api_client.is_oauth and with_credentials:
+            headers.update({'Authorization': 'Bearer ' + api_client.access_token})
+        data = json.dumps(body) if method in ('POST', 'PUT', 'PATCH') else None
+
+        for attempt in range(max_retries + 1):
+            try:
+                res = send(method, url, query_params, headers, data, auth)
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as err:
+                res, error = None, err
+            retry = res is None or res.status_code in rs.RETRY_STATUS_CODES
+            if circuit_breaker is not None:
+                circuit_breaker.record(not retry)
+            if concurrency is not None:
+                if res is not None and res.status_code == 429:
+                    concurrency.on_throttle()
+                elif not retry:
+                    concurrency.on_success()
+            if not retry or attempt == max_retries:
+                break
+            retry_after = res.headers.get('Retry-After') if res is not None else None
+            delay = retry_policy.get_delay(attempt, retry_after)
+            logger.debug("%s %s failed (%s), retry %d of %d in %.1fs.", method, url, error or res.status_code,
+                         attempt + 1, max_retries, delay)
+            time.sleep(delay)
+        if error is not None:
+            raise error
+
+        return res
+
+    return request
 
 
 def get_filenames_containing(substr, path='.'):
@@ -118,7 +288,7 @@ def delete_files_containing(substr, path):
     to_be_deleted = get_filenames_containing(substr, path)
     for delete_me_fname in to_be_deleted:
         os.remove(path + delete_me_fname)
-        print(f"File {delete_me_fname} was deleted.")
+        logger.info("File %s was deleted.", delete_me_fname)
 
 
 def create_new_entry(client, list_id, mail_addr, merge_fields, tags):
@@ -130,14 +300,21 @@ def create_new_entry(client, list_id, mail_addr, merge_fields, tags):
         mail_addr ([str]): mail adress of the entry. Used as the primary identifier.
         merge_fields ([dict]): A dictionary contain information for additional fields.
         tags ([list]): Contains a list of tags that will be added.
+
+    Returns:
+        [bool]: True if the entry was created.
     """
     try:
         response = client.lists.add_list_member(list_id,
                                                 {"email_address": mail_addr, "status": "subscribed", "tags": tags,
                                                  "merge_fields": merge_fields})
-        print(response)
-    except ApiClientError as error:
-        print("Error on mail address {}: {}".format(mail_addr, error.text))
+        logger.debug("Created %s: %s", mail_addr, response)
+    except api_client_error() as error:
+        # existing members are rejected here and updated by update_existing_entry()
+        logger.debug("Error on creating mail address %s: %s", mail_addr, error.text)
+        return False
+
+    return True
 
 
 def hash_string(input_str):
@@ -156,7 +333,41 @@ def hash_string(input_str):
     return input_hash_str
 
 
-def update_existing_entry(client, list_id, mail_addr, merge_fields, l_tags):
+def hash_strings(input_strs):
+    """Hashes a whole column like hash_string(), every distinct value is hashed only once.
+
+    Args:
+        input_strs ([series]): Strings that shall be hashed, without missing values.
+
+    Returns:
+        [series]: MD5 hashes of the lowercased strings, with the index of the input.
+    """
+    codes, uniques = pd.factorize(input_strs.str.lower())
+    md5 = hashlib.md5
+    hashes = np.array([md5(value.encode()).hexdigest() for value in uniques.tolist()], dtype=object)
+
+    return pd.Series(hashes[codes], index=input_strs.index, dtype=object)
+
+
+def get_subscriber_hashes(df_to_mc):
+    """Returns the subscriber hash of every entry that is sent to mailchimp. The hashes computed by
+        pf.aggregate_per_mailadress() are the index of the dataframe returned by pf.process_to_mailchimp(), for other
+        dataframes they are computed from the mail addresses in the first column.
+
+    Args:
+        df_to_mc ([dataframe]): Dataframe with entries that shall be sent to mailchimp, mail address first.
+
+    Returns:
+        [dict]: Mapping of mail address to subscriber hash.
+    """
+    mail_addrs = df_to_mc.iloc[:, 0]
+    if df_to_mc.index.name == 'subscriber_hash':
+        return dict(zip(mail_addrs, df_to_mc.index))
+
+    return dict(zip(mail_addrs, hash_strings(mail_addrs.astype(str))))
+
+
+def update_existing_entry(client, list_id, mail_addr, merge_fields, l_tags, mail_h=None):
     """Tries to update an existing entry.
 
     Args:
@@ -165,24 +376,132 @@ def update_existing_entry(client, list_id, mail_addr, merge_fields, l_tags):
         mail_addr ([str]): mail adress of the entry. Used as the primary identifier.
         merge_fields ([dict]): A dictionary contain information for additional fields.
         tags ([list]): Contains a list of tags that will be added.
+        mail_h (str, optional): Subscriber hash of the mail address, see get_subscriber_hashes(). Defaults to None,
+            which hashes the mail address.
+
+    Returns:
+        [list]: Error messages of all failed requests, empty if the entry was updated successfully.
     """
+    errors = []
     # hash mail address        
-    mail_h = hash_string(mail_addr)
+    mail_h = mail_h or hash_string(mail_addr)
     # send entry
     try:
         response = client.lists.set_list_member(list_id, mail_h,
                                                 {"email_address": mail_addr, "status_if_new": "subscribed",
                                                  "status": "subscribed", "merge_fields": merge_fields})
-        print(response)
-    except ApiClientError as error:
-        print("Error on mail address {}: {}".format(mail_addr, error.text))
-    for tag in l_tags:
+        logger.debug("Updated %s: %s", mail_addr, response)
+    except api_client_error() as error:
+        logger.warning("Error on mail address %s: %s", mail_addr, error.text)
+        errors.append(rs.SendError(str(error.text), error.status_code))
+    errors.extend(add_tags(client, list_id, mail_addr, l_tags, mail_h))
+
+    return errors
+
+
+def add_tags(client, list_id, mail_addr, l_tags, mail_h=None):
+    """Activates all given tags of an existing entry with one request.
+
+    Args:
+        client: Client object from mailchimp. Needed for communication with the service.
+        list_id ([str]): ID of the list where the entry is stored.
+        mail_addr ([str]): mail adress of the entry. Used as the primary identifier.
+        l_tags ([list]): Contains a list of tags that will be added.
+        mail_h (str, optional): Subscriber hash of the mail address. Defaults to None, which hashes the mail address.
+
+    Returns:
+        [list]: Error messages of all failed requests, empty if the tags were added successfully.
+    """
+    if not l_tags:
+        return []
+    try:
+        response = client.lists.update_list_member_tags(list_id, mail_h or hash_string(mail_addr),
+                                                {"tags": [{"name": tag, "status": "active"} for tag in l_tags]})
+        logger.debug("Tagged %s: %s", mail_addr, response)
+    except api_client_error() as error:
+        logger.warning("Error on updating tags %s for mail address %s: %s", l_tags, mail_addr, error.text)
+        return [rs.SendError(str(error.text), error.status_code)]
+
+    return []
+
+
+def get_audience(client, list_id, page_size=1000):
+    """Loads all members of a list once, so that it can be decided locally if an entry has to be created or updated.
+
+    Args:
+        client: Client object from mailchimp. Needed for communication with the service.
+        list_id ([str]): ID of the list whose members are loaded.
+        page_size (int, optional): Members per request, mailchimp allows at most 1000. Defaults to 1000.
+
+    Returns:
+        [dict]: Mapping of subscriber hash to a dict with the current merge fields and the set of tag names.
+    """
+    audience = {}
+    offset = 0
+    fields = ['members.email_address', 'members.merge_fields', 'members.tags', 'total_items']
+    while True:
+        response = client.lists.get_list_members_info(list_id, count=page_size, offset=offset, fields=fields)
+        members = response.get('members', [])
+        for member in members:
+            audience[hash_string(member['email_address'])] = {
+                "merge_fields": member.get('merge_fields', {}),
+                "tags": {tag['name'] for tag in member.get('tags', [])},
+            }
+        offset += len(members)
+        if not members or offset >= response.get('total_items', 0):
+            break
+    logger.info("Loaded %d members of list %s.", len(audience), list_id)
+
+    return audience
+
+
+def sync_entry(client, list_id, mail_addr, merge_fields, l_tags, audience, mail_h=None):
+    """Creates or updates an entry depending on the prefetched audience, so that only needed requests are sent.
+        New entries are created with all tags in one request. Existing entries are only updated if their
+        merge fields changed and get all missing tags with one request. If an entry that is not in the audience
+        can not be created, e.g. because it subscribed after the audience was loaded, it is updated instead.
+
+    Args:
+        client: Client object from mailchimp. Needed for communication with the service.
+        list_id ([str]): ID of the list where the entry should be added.
+        mail_addr ([str]): mail adress of the entry. Used as the primary identifier.
+        merge_fields ([dict]): A dictionary contain information for additional fields.
+        l_tags ([list]): Contains a list of tags that will be added.
+        audience ([dict]): Members of the list as returned by get_audience(). Is updated with the sent data.
+        mail_h (str, optional): Subscriber hash of the mail address. Defaults to None, which hashes the mail address.
+
+    Returns:
+        [list]: Error messages of all failed requests, empty if the entry is up to date.
+    """
+    mail_h = mail_h or hash_string(mail_addr)
+    existing = audience.get(mail_h)
+    created_elsewhere = False
+    if existing is None:
+        if create_new_entry(client, list_id, mail_addr, merge_fields, l_tags):
+            audience[mail_h] = {"merge_fields": dict(merge_fields), "tags": set(l_tags)}
+            return []
+        # the member may exist nonetheless, e.g. a retried create that went through, so all data is updated
+        logger.debug("Could not create mail address %s, it is updated instead.", mail_addr)
+        existing = audience.setdefault(mail_h, {"merge_fields": {}, "tags": set()})
+        created_elsewhere = True
+
+    errors = []
+    if created_elsewhere or any(existing['merge_fields'].get(key) != value for key, value in merge_fields.items()):
         try:
-            response = client.lists.update_list_member_tags(list_id, mail_h, 
-                                                    {"tags": [{"name": tag, "status": "active"}]})
-            print(response)
-        except ApiClientError as error:
-            print("Error on updating tag '{}' for mail address {}: {}".format(tag, mail_addr, error.text))
+            response = client.lists.set_list_member(list_id, mail_h,
+                                                    {"email_address": mail_addr, "status_if_new": "subscribed",
+                                                     "status": "subscribed", "merge_fields": merge_fields})
+            logger.debug("Updated %s: %s", mail_addr, response)
+            existing['merge_fields'].update(merge_fields)
+        except api_client_error() as error:
+            logger.warning("Error on mail address %s: %s", mail_addr, error.text)
+            errors.append(rs.SendError(str(error.text), error.status_code))
+    missing_tags = [tag for tag in l_tags if tag not in existing['tags']]
+    tag_errors = add_tags(client, list_id, mail_addr, missing_tags, mail_h)
+    if not tag_errors:
+        existing['tags'].update(missing_tags)
+
+    return errors + tag_errors
 
 
 
@@ -0,0 +1,55 @@
+import logging
+import os
+import re
+import sys
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(message)s'
+LOG_FILE_FORMAT = '%(asctime)s %(levelname)-7s %(processName)s %(name)s: %(message)s'
+MAIL_PATTERN = re.compile(r'([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,})')
+
+
+def mask_emails(text):
+    """Masks all mail addresses in the text, e.g. 'anna.mueller@example.org' becomes 'a***@example.org'."""
+    return MAIL_PATTERN.sub(r'\1***@\2', text)
+
+
+class MaskingFormatter(logging.Formatter):
+    """Formatter that masks the mail addresses in every formatted record, including tracebacks."""
+
+    def format(self, record):
+        return mask_emails(super().format(record))
+
+
+def setup_logging(level='INFO', log_path='', timest='', mask=True):
+    """Configures the root logger for one run: log records go to stdout and, if log_path is given, to a log file
+        of this run. Records are only formatted if their level is enabled.
+
+    Args:
+        level (str, optional): Minimal level of the records that are logged, e.g. 'DEBUG'. Defaults to 'INFO'.
+        log_path (str, optional): Folder of the log files, '' logs to stdout only. Defaults to ''.
+        timest (str, optional): Timestamp of the run, used in the name of the log file. Defaults to ''.
+        mask (bool, optional): Mask the mail addresses in all log records. Defaults to True.
+
+    Returns:
+        [str]: Path of the log file of this run, '' if there is none.
+    """
+    formatter_class = MaskingFormatter if mask else logging.Formatter
+    handlers = [logging.StreamHandler(sys.stdout)]
+    handlers[0].setFormatter(formatter_class(LOG_FORMAT))
+    log_file = ''
+    if log_path:
+        os.makedirs(log_path, exist_ok=True)
+        log_file = os.path.join(log_path, f"run_{timest}.log")
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        handlers[1].setFormatter(formatter_class(LOG_FILE_FORMAT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level.upper())
+    # the connection pool of requests logs every request on DEBUG
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    return log_file
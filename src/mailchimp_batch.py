@@ -0,0 +1,196 @@
+import io
+import logging
+import json
+import tarfile
+import time
+from . import helper_functions as hf
+from . import resilience as rs
+
+# Mailchimp accepts at most 500 members per call of the batch subscribe endpoint
+MAX_MEMBERS_PER_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_list(l_input, chunk_size):
+    """Helper function to split a list into chunks of a given size.
+
+    Args:
+        l_input ([list]): List that shall be split.
+        chunk_size ([int]): Maximal number of elements per chunk.
+
+    Returns:
+        [list]: List of lists with at most chunk_size elements each.
+    """
+    return [l_input[i:i + chunk_size] for i in range(0, len(l_input), chunk_size)]
+
+
+def batch_upsert_members(client, list_id, members, chunk_size=MAX_MEMBERS_PER_BATCH):
+    """Creates or updates members in chunks via the batch subscribe endpoint (lists.batch_list_members).
+
+    Args:
+        client: Client object from mailchimp. Needed for communication with the service.
+        list_id ([str]): ID of the list where the entries should be added.
+        members ([list]): List of member dicts with the keys email_address, status and merge_fields.
+        chunk_size (int, optional): Members per request. Defaults to MAX_MEMBERS_PER_BATCH.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all members that were rejected.
+    """
+    errors = {}
+    for chunk in chunk_list(members, chunk_size):
+        try:
+            response = client.lists.batch_list_members(list_id, {"members": chunk, "update_existing": True})
+        except hf.api_client_error() as error:
+            # the whole chunk failed, so every member of it is marked as failed
+            for member in chunk:
+                errors[member['email_address']] = rs.SendError(str(error.text), error.status_code)
+            continue
+        logger.info("Batch upsert: %d created, %d updated, %d errors.", response.get('total_created', 0),
+                    response.get('total_updated', 0), response.get('error_count', 0))
+        for error in response.get('errors', []):
+            # mailchimp rejected the member, e.g. an invalid mail address
+            errors[error.get('email_address', '')] = rs.SendError(error.get('error', ''), 400)
+
+    return errors
+
+
+def build_tag_operations(list_id, mail_tags, mail_hashes=None):
+    """Builds the operations for a batch request that adds tags to members.
+
+    Args:
+        list_id ([str]): ID of the list where the entries are stored.
+        mail_tags ([dict]): Mapping of mail address to a list of tags.
+        mail_hashes (dict, optional): Mapping of mail address to subscriber hash, see hf.get_subscriber_hashes().
+            Defaults to None, which hashes every mail address.
+
+    Returns:
+        [list]: List of batch operations, the mail address is used as operation_id.
+    """
+    mail_hashes = mail_hashes or {}
+    operations = []
+    for mail_addr, tags in mail_tags.items():
+        if not tags:
+            continue
+        mail_h = mail_hashes.get(mail_addr) or hf.hash_string(mail_addr)
+        operations.append({
+            "method": "POST",
+            "path": f"/lists/{list_id}/members/{mail_h}/tags",
+            "operation_id": mail_addr,
+            "body": json.dumps({"tags": [{"name": tag, "status": "active"} for tag in tags]}),
+        })
+
+    return operations
+
+
+def poll_batch_status(client, batch_id, poll_interval=2.0, timeout=600.0):
+    """Polls the status of a batch request until it is finished.
+
+    Args:
+        client: Client object from mailchimp. Needed for communication with the service.
+        batch_id ([str]): ID of the batch request.
+        poll_interval (float, optional): Seconds to wait between two status requests. Defaults to 2.0.
+        timeout (float, optional): Seconds after which polling is given up. Defaults to 600.0.
+
+    Returns:
+        [dict]: Last status response of the batch request.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.batches.status(batch_id)
+        if response.get('status') == 'finished':
+            return response
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Batch {batch_id} not finished after {timeout} seconds.")
+        time.sleep(poll_interval)
+
+
+def get_batch_errors(client, response_body_url, operation_ids=()):
+    """Downloads the results of a finished batch request and extracts all failed operations.
+
+    Args:
+        client: Client object from mailchimp, the archive is downloaded with its retries, circuit breaker and metrics.
+        response_body_url ([str]): URL of the gzipped tar archive with the results of the batch request.
+        operation_ids (list, optional): Ids of all operations of the batch request, they count as failed if the
+            results can not be downloaded. Defaults to ().
+
+    Returns:
+        [dict]: Mapping of operation_id to error message for all failed operations.
+    """
+    # imported here like the mailchimp client, only needed once a batch was sent
+    import requests
+
+    try:
+        # the archive is stored outside the api and must not get the api key
+        res = client.api_client.request('GET', response_body_url, headers={}, with_credentials=False)
+        res.raise_for_status()
+        return read_batch_errors(res.content)
+    except (requests.RequestException, rs.CircuitOpenError, tarfile.TarError, ValueError) as error:
+        logger.warning("Could not download the results of the batch request from %s: %s", response_body_url, error)
+        return {operation_id: rs.SendError(f"Result of the batch request unknown: {error}")
+                for operation_id in operation_ids}
+
+
+def read_batch_errors(content):
+    """Extracts all failed operations from the gzipped tar archive with the results of a batch request.
+
+    Returns:
+        [dict]: Mapping of operation_id to error message for all failed operations.
+    """
+    errors = {}
+    with tarfile.open(fileobj=io.BytesIO(content), mode='r:gz') as archive:
+        for member in archive.getmembers():
+            if not member.isfile():
+                continue
+            for result in json.load(archive.extractfile(member)):
+                if result.get('status_code', 200) >= 400:
+                    try:
+                        detail = json.loads(result.get('response') or '{}').get('detail', '')
+                    except ValueError:
+                        detail = result.get('response', '')
+                    errors[result.get('operation_id', '')] = rs.SendError(detail, result['status_code'])
+
+    return errors
+
+
+def batch_add_tags(client, list_id, mail_tags, poll_interval=2.0, timeout=600.0, mail_hashes=None):
+    """Adds tags to members with one batch request and waits until mailchimp has processed it.
+
+    Args:
+        client: Client object from mailchimp. Needed for communication with the service.
+        list_id ([str]): ID of the list where the entries are stored.
+        mail_tags ([dict]): Mapping of mail address to a list of tags.
+        poll_interval (float, optional): Seconds to wait between two status requests. Defaults to 2.0.
+        timeout (float, optional): Seconds after which polling is given up. Defaults to 600.0.
+        mail_hashes (dict, optional): Mapping of mail address to subscriber hash. Defaults to None.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all members whose tags could not be set. If the batch
+            was started but is not finished within the timeout, the batch id is logged and all its operations are
+            returned as pending errors, see rs.SendError.
+    """
+    operations = build_tag_operations(list_id, mail_tags, mail_hashes)
+    if not operations:
+        return {}
+
+    try:
+        response = client.batches.start({"operations": operations})
+    except hf.api_client_error() as error:
+        return {operation['operation_id']: rs.SendError(str(error.text), error.status_code)
+                for operation in operations}
+    try:
+        status = poll_batch_status(client, response['id'], poll_interval, timeout)
+    except (hf.api_client_error(), TimeoutError) as error:
+        # mailchimp accepted the batch and processes it nonetheless
+        text = error.text if isinstance(error, hf.api_client_error()) else str(error)
+        logger.warning("%d tag operations are pending: %s Check the batch with client.batches.status('%s').",
+                       len(operations), text, response['id'])
+        return {operation['operation_id']: rs.SendError(f"Tags pending in batch {response['id']}", pending=True)
+                for operation in operations}
+    logger.info("Batch %s finished: %d operations, %d errors.", status['id'], status.get('finished_operations', 0),
+                status.get('errored_operations', 0))
+
+    if status.get('errored_operations', 0) == 0:
+        return {}
+    return get_batch_errors(client, status['response_body_url'],
+                            [operation['operation_id'] for operation in operations])
@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_PREFIX = 'mailchimp_etl'
+
+logger = logging.getLogger(__name__)
+
+
+def get_peak_rss_mb():
+    """Returns the peak resident memory of this process since it started in MB, None if it can not be determined.
+        The peak can not be reset, so the memory of a stage is measured by how much it raised the peak.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def get_endpoint(method, url):
+    """Returns the endpoint of a request without ids, e.g. 'PUT /lists/{id}/members/{id}'."""
+    path = re.sub(r'^/3\.0', '', urlparse(url).path)
+    path = re.sub(r'(/(?:lists|members|batches))/[^/]+', r'\1/{id}', path)
+    # the results of a batch request are downloaded from an archive named after the batch
+    path = re.sub(r'[^/]+\.tar\.gz$', '{id}.tar.gz', path)
+
+    return f"{method} {path}"
+
+
+class RunMetrics:
+    """Collects the timings, row counts and memory of the stages and the mailchimp calls of one run.
+        Can be shared between threads. Stages that run several times, e.g. per file or per chunk, are summed up.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.stages = {}
+        self.api_calls = {}
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, rows_in=None, log_level=logging.INFO):
+        """Times the enclosed block as the given stage and logs one summary line for it.
+            The yielded dict takes the rows the stage put out as 'rows_out'.
+
+        Args:
+            name ([str]): Name of the stage, e.g. 'load' or 'send'.
+            rows_in ([int], optional): Rows the stage gets as input. Defaults to None.
+            log_level (int, optional): Level of the summary line, e.g. logging.DEBUG for stages that run per chunk.
+                Defaults to logging.INFO.
+        """
+        record = {'rows_out': None}
+        peak_before = get_peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            self.add_stage(name, seconds, rows_in, record['rows_out'], peak_before=peak_before)
+            logger.log(log_level, "Stage %s took %.3fs (rows in: %s, rows out: %s).", name, seconds, rows_in,
+                       record['rows_out'])
+
+    def iter_stage(self, name, iterable):
+        """Yields from the iterable and times every step as the given stage, e.g. reading the chunks of a file."""
+        iterator = iter(iterable)
+        while True:
+            peak_before = get_peak_rss_mb()
+            start = time.perf_counter()
+            item = next(iterator, None)
+            if item is None:
+                return
+            self.add_stage(name, time.perf_counter() - start, rows_out=len(item), peak_before=peak_before)
+            yield item
+
+    def add_stage(self, name, seconds, rows_in=None, rows_out=None, calls=1, process_peak_rss_mb=None,
+                  rss_growth_mb=None, peak_before=None):
+        """Adds one or more runs of a stage.
+
+        Args:
+            process_peak_rss_mb ([float], optional): Peak memory of the process after the stage. Defaults to None,
+                i.e. the current peak.
+            rss_growth_mb ([float], optional): How much the stage raised the peak memory of the process.
+                Defaults to None, i.e. the current peak minus peak_before.
+            peak_before ([float], optional): Peak memory of the process before the stage. Defaults to None.
+        """
+        if process_peak_rss_mb is None:
+            process_peak_rss_mb = get_peak_rss_mb()
+        if rss_growth_mb is None and None not in (peak_before, process_peak_rss_mb):
+            rss_growth_mb = process_peak_rss_mb - peak_before
+        with self.lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                                  'process_peak_rss_mb': None, 'rss_growth_mb': None})
+            stage['calls'] += calls
+            stage['seconds'] += seconds
+            stage['rows_in'] += rows_in or 0
+            stage['rows_out'] += rows_out or 0
+            # stages that run several times report their largest value
+            if process_peak_rss_mb is not None:
+                stage['process_peak_rss_mb'] = max(stage['process_peak_rss_mb'] or 0.0, process_peak_rss_mb)
+            if rss_growth_mb is not None:
+                stage['rss_growth_mb'] = max(stage['rss_growth_mb'] or 0.0, rss_growth_mb)
+
+    def record_api_call(self, method, url, outcome, seconds):
+        """Counts one request to mailchimp by endpoint and outcome and adds its latency to the histogram.
+
+        Args:
+            method ([str]): HTTP method of the request.
+            url ([str]): URL of the request.
+            outcome ([str]): Status code of the response or the name of the exception.
+            seconds ([float]): Latency of the request.
+        """
+        endpoint = get_endpoint(method, url)
+        with self.lock:
+            key = (endpoint, str(outcome))
+            self.api_calls[key] = self.api_calls.get(key, 0) + 1
+            latency = self.latencies.setdefault(endpoint, {'count': 0, 'sum': 0.0,
+                                                           'buckets': [0] * len(LATENCY_BUCKETS)})
+            latency['count'] += 1
+            latency['sum'] += seconds
+            for i, upper_bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= upper_bound:
+                    latency['buckets'][i] += 1
+                    break
+
+    def merge(self, snapshot):
+        """Adds the metrics of another process, as returned by to_dict()."""
+        for name, stage in snapshot['stages'].items():
+            self.add_stage(name, stage['seconds'], stage['rows_in'], stage['rows_out'], stage['calls'],
+                           stage['process_peak_rss_mb'], stage['rss_growth_mb'])
+        with self.lock:
+            for call in snapshot['api_calls']:
+                key = (call['endpoint'], call['outcome'])
+                self.api_calls[key] = self.api_calls.get(key, 0) + call['calls']
+            for endpoint, other in snapshot['latencies'].items():
+                latency = self.latencies.setdefault(endpoint, {'count': 0, 'sum': 0.0,
+                                                               'buckets': [0] * len(LATENCY_BUCKETS)})
+                latency['count'] += other['count']
+                latency['sum'] += other['sum']
+                latency['buckets'] = [a + b for a, b in zip(latency['buckets'], other['buckets'])]
+
+    def to_dict(self):
+        """Returns the metrics as JSON serializable dict, the histogram buckets are not cumulative."""
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'api_calls': [{'endpoint': endpoint, 'outcome': outcome, 'calls': calls}
+                              for (endpoint, outcome), calls in sorted(self.api_calls.items())],
+                'latencies': {endpoint: dict(latency, buckets=list(latency['buckets']))
+                              for endpoint, latency in self.latencies.items()},
+                'latency_buckets': list(LATENCY_BUCKETS),
+            }
+
+    def to_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        report = self.to_dict()
+        prefix = PROMETHEUS_PREFIX
+        lines = []
+        for metric, key, kind, help_text in [
+                ('stage_seconds_total', 'seconds', 'counter', 'Time spent in the stage.'),
+                ('stage_calls_total', 'calls', 'counter', 'Number of times the stage ran.'),
+                ('stage_rows_in_total', 'rows_in', 'counter', 'Rows the stage got as input.'),
+                ('stage_rows_out_total', 'rows_out', 'counter', 'Rows the stage put out.'),
+                ('stage_process_peak_rss_megabytes', 'process_peak_rss_mb', 'gauge',
+                 'Peak resident memory of the process after the stage.'),
+                ('stage_rss_growth_megabytes', 'rss_growth_mb', 'gauge',
+                 'Largest rise of the peak resident memory during one run of the stage.')]:
+            lines += [f"# HELP {prefix}_{metric} {help_text}", f"# TYPE {prefix}_{metric} {kind}"]
+            lines += [f'{prefix}_{metric}{{stage="{name}"}} {stage[key]}'
+                      for name, stage in report['stages'].items() if stage[key] is not None]
+
+        lines += [f"# HELP {prefix}_api_calls_total Requests to mailchimp by endpoint and outcome.",
+                  f"# TYPE {prefix}_api_calls_total counter"]
+        lines += [f'{prefix}_api_calls_total{{endpoint="{call["endpoint"]}",outcome="{call["outcome"]}"}} '
+                  f'{call["calls"]}' for call in report['api_calls']]
+
+        lines += [f"# HELP {prefix}_api_latency_seconds Latency of the requests to mailchimp.",
+                  f"# TYPE {prefix}_api_latency_seconds histogram"]
+        for endpoint, latency in report['latencies'].items():
+            cumulative = 0
+            for upper_bound, count in zip(LATENCY_BUCKETS, latency['buckets']):
+                cumulative += count
+                lines.append(f'{prefix}_api_latency_seconds_bucket{{endpoint="{endpoint}",le="{upper_bound}"}} '
+                             f'{cumulative}')
+            lines += [f'{prefix}_api_latency_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {latency["count"]}',
+                      f'{prefix}_api_latency_seconds_sum{{endpoint="{endpoint}"}} {latency["sum"]}',
+                      f'{prefix}_api_latency_seconds_count{{endpoint="{endpoint}"}} {latency["count"]}']
+
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics of the current run in this process
+METRICS = RunMetrics()
+
+
+def collect(func, *args):
+    """Runs func with fresh metrics, e.g. in a worker process, and returns its result and the collected metrics.
+
+    Returns:
+        [tuple]: Result of func and the metrics as returned by RunMetrics.to_dict(), to be merged by the caller.
+    """
+    global METRICS
+    outer, METRICS = METRICS, RunMetrics()
+    try:
+        return func(*args), METRICS.to_dict()
+    finally:
+        METRICS = outer
+
+
+def write_report(metrics, metrics_path, timest, formats=('json',)):
+    """Writes the run report into the given folder.
+
+    Args:
+        metrics ([RunMetrics]): Metrics of the run.
+        metrics_path ([str]): Folder of the run reports.
+        timest ([str]): Timestamp of the run, used in the file names.
+        formats (tuple, optional): 'json' and/or 'prometheus'. Defaults to ('json',).
+
+    Returns:
+        [list]: Paths of the written files.
+    """
+    os.makedirs(metrics_path, exist_ok=True)
+    written = []
+    if 'json' in formats:
+        fpath = os.path.join(metrics_path, f"run_{timest}.json")
+        with open(fpath, 'w', encoding='utf-8') as f:
+            json.dump(metrics.to_dict(), f, indent=2)
+        written.append(fpath)
+    if 'prometheus' in formats:
+        fpath = os.path.join(metrics_path, f"run_{timest}.prom")
+        with open(fpath, 'w', encoding='utf-8') as f:
+            f.write(metrics.to_prometheus())
+        written.append(fpath)
+
+    return written
@@ -1,158 +1,215 @@
-import json
+import logging
+import numpy as np
 import pandas as pd
 import shutil
 import os
-import mailchimp_marketing as MailchimpMarketing
 from . import helper_functions as hf
+from . import mailchimp_batch as mcb
+from . import concurrent_sender as cs
+from . import sync_state as ss
+from . import resilience as rs
+from . import metrics as mt
 
-def from_fundraisingbox(df_input, mode=''):
-    """Function to extract all relevant data from the FundraisingBox file.
+# Same check as the stand-in server: one @, no whitespace and a dot in the domain
+MAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s]+'
+
+logger = logging.getLogger(__name__)
+
+def fill_missing(df_input, value):
+    """Fills missing values like DataFrame.fillna(value), but also works for the typed columns of src/schemas.py.
+        Categorical columns get the value as additional category, nullable integer columns (flags) are filled with 0.
 
     Args:
-        df_input ([dataframe]): Dataframe containing the info from the raw csv file.
+        df_input ([dataframe]): Dataframe with missing values.
+        value ([str]): Value that is used for missing values.
 
     Returns:
-        [dataframe]: Returns a dataframe with all relevant data extracted from the raw csv FundraisingBox file.
+        [dataframe]: Dataframe without missing values.
     """
-    print(f"Start from_fundraisingbox() ...")
-    # Get Input Dataframe
-    df_fundraising_box = df_input.copy()
-    
-    # Get rid of entries with no donation meta info
-    df_fund_trans = df_fundraising_box.dropna(subset=['donation_meta_info']).copy()
-            
-    # Fill missing values with an empty string
-    df_fund_trans = df_fund_trans.fillna('')
-    
-    # Extract information about if the user wants a newsletter
-    df_fund_trans['donation_meta_info_dict'] = df_fund_trans.apply(lambda x: json.loads(x['donation_meta_info']), axis=1)
-    df_fund_trans['wants_nl'] = df_fund_trans.apply(lambda x: 
-        json.loads(x['donation_meta_info'])['wants_newsletter'] 
-            if 'wants_newsletter' in json.loads(x['donation_meta_info'])
-            else ''
-        , axis=1)
-
-    # Select all donators who want a newsletter
-    df_fund_want_nl = df_fund_trans[df_fund_trans['wants_nl'] == '1'].copy()
-    
-    # Cast some datetypes
-    # df_fund_want_nl['post_code'] = df_fund_want_nl['post_code'].astype(int)
-    df_fund_want_nl['post_code'] = df_fund_want_nl['post_code'].astype(str)
-    df_fund_want_nl['state'] = df_fund_want_nl['state'].astype(str)
-    
-    # Transform columns from FundraisingBox to a Mailchimp compatible format
-    df_fund_want_nl['address_for_chimp'] = df_fund_want_nl.apply(
-                lambda x: x['address']+'  '
-                +x['city']+'  '
-                +x['state']+'  '
-                +x['post_code']+'  '
-                +x['country']
-                , axis=1)
-                
-    df_fund_want_nl['address_for_chimp_dict'] = df_fund_want_nl.apply(
-                lambda x: 
-                {
-                "addr1" : x['address'],
-                "addr2" : "",
-                "city" : x['city'],
-                "state": x['state'],
-                "zip": x['post_code'],
-                "country": x['country']
-                }
-                , axis=1)
-
-    # Find out if donator is recurring
-    df_fund_want_nl['ist_dauerspender'] = df_fund_want_nl.apply(lambda x: 1 if x['by_recurring']==1 else 0, axis=1)
-    df_fund_want_nl['ist_einzelspender'] = df_fund_want_nl.apply(lambda x: 0 if x['ist_dauerspender']==1 else 1, axis=1)
-    
-    # prepare outputs
-    df_output = df_fund_want_nl
-    
-    # DEBUG
-    hf.out_for_debug(df_output, 'from_fundraisingbox', mode)
-    
-    return df_output
+    categoricals = {col: pd.CategoricalDtype(list(dtype.categories) + [value])
+                    for col, dtype in df_input.dtypes.items()
+                    if isinstance(dtype, pd.CategoricalDtype) and value not in dtype.categories}
+    df_output = df_input.astype(categoricals) if categoricals else df_input
+    fill_values = {col: 0 if pd.api.types.is_extension_array_dtype(dtype) and pd.api.types.is_integer_dtype(dtype)
+                   else value for col, dtype in df_output.dtypes.items()}
 
+    return df_output.fillna(fill_values)
 
-def from_twingle(df_input, mode=''):
-    """Function to extract all relevant data from the twingle file.
+
+def build_address_string(street, city, state, post_code, country):
+    """Builds the address string for mailchimp column-wise, the parts are separated by two spaces.
 
     Args:
-        df_input ([dataframe]): Dataframe containing the info from the raw csv file.
+        street ([series]): Street and house number.
+        city ([series]): City.
+        state ([series or str]): State.
+        post_code ([series]): Post code.
+        country ([series]): Country.
 
     Returns:
-        [dataframe]: Returns a dataframe with all relevant data extracted from the raw csv FundraisingBox file.
+        [series]: Address strings in the format 'street  city  state  post_code  country'.
     """
-    print(f"Start from_twingle() ...")
-    # Get Input Dataframe
-    df_twingle = df_input.copy()
-    
-    # Get rid of entries with no donation meta info
-    print(df_twingle)
-    df_twingle_transf = df_twingle.dropna(subset=['newsletter']).copy()
-    print(df_twingle_transf)
-    
-    # Fill missing values with an empty string
-    df_twingle_transf = df_twingle_transf.fillna(' ')
-    print(f"df after fillna{df_twingle_transf}")
-    
-    # rename columns
-    col_map_rename = [
-        ('user_email', 'email_address'),
-        ('user_firstname', 'first_name'),
-        ('user_lastname', 'last_name'),
-        ('user_telephone', 'phone'),
-        ('newsletter','wants_nl'),
-        ('trx_id','donation_id'),
-    ]
-    for mapping in col_map_rename:
-        col_twing = mapping[0]
-        col_chimp = mapping[1]
-        df_twingle_transf[col_chimp] = df_twingle_transf[col_twing]
-    print(f"df after rename col mapping{df_twingle_transf}")
+    parts = [part.astype(str) if isinstance(part, pd.Series) else part
+             for part in (street, city, state, post_code, country)]
 
-    # Select all donators who want a newsletter
-    df_twingle_transf_nl = df_twingle_transf[df_twingle_transf['wants_nl'] == 1].copy()
-    print(f"df after nl == 1 {df_twingle_transf_nl}")
-    
-    # Cast some datetypes
-    df_twingle_transf_nl['user_postal_code'] = df_twingle_transf_nl['user_postal_code'].astype(str)
-    df_twingle_transf_nl['user_street'] = df_twingle_transf_nl['user_street'].astype(str)
-    
-    # Transform columns from FundraisingBox to a Mailchimp compatible format
-    print(df_twingle_transf_nl.columns)
-    print(df_twingle_transf_nl)
-    df_twingle_transf_nl['address_for_chimp'] = df_twingle_transf_nl.apply(
-                lambda x:
-                    x['user_street']+'  '
-                    +x['user_city']+'  '
-                    +''+'  '
-                    +x['user_postal_code']+'  '
-                    +x['user_country']
-                , axis=1)
-                
-    df_twingle_transf_nl['address_for_chimp_dict'] = df_twingle_transf_nl.apply(
-                lambda x: 
-                    {
-                    "addr1" : x['user_street'],
-                    "addr2" : "",
-                    "city" : x['user_city'],
-                    "state": "",
-                    "zip": x['user_postal_code'],
-                    "country": x['user_country']
-                    }
-                , axis=1)
-
-    # Find out if donator is recurring
-    df_twingle_transf_nl['ist_dauerspender'] = df_twingle_transf_nl.apply(lambda x: 1 if x['recurring']==1 else 0, axis=1)
-    df_twingle_transf_nl['ist_einzelspender'] = df_twingle_transf_nl.apply(lambda x: 0 if x['ist_dauerspender']==1 else 1, axis=1)
-    
-    # prepare outputs
-    df_output = df_twingle_transf_nl
+    return parts[0] + '  ' + parts[1] + '  ' + parts[2] + '  ' + parts[3] + '  ' + parts[4]
+
+
+def build_address_dicts(street, city, state, post_code, country):
+    """Builds the address dicts for the mailchimp merge field ADDRESS column-wise.
+
+    Args:
+        street ([series]): Street and house number.
+        city ([series]): City.
+        state ([series or str]): State.
+        post_code ([series]): Post code.
+        country ([series]): Country.
+
+    Returns:
+        [series]: Dicts with the keys addr1, addr2, city, state, zip and country.
+    """
+    keys = ("addr1", "addr2", "city", "state", "zip", "country")
+    parts = [part.tolist() if isinstance(part, pd.Series) else [part] * len(street)
+             for part in (street, "", city, state, post_code, country)]
+
+    return pd.Series([dict(zip(keys, values)) for values in zip(*parts)], index=street.index, dtype=object)
+
+
+def get_spender_tags(dauerspender_sum, einzelspender_sum):
+    """Determines the tags 'Einzelspender/in' and 'Dauerspender/in' column-wise from the number of donations.
+
+    Args:
+        dauerspender_sum ([series]): Number of recurring donations per mail address.
+        einzelspender_sum ([series]): Number of single donations per mail address.
+
+    Returns:
+        [series]: List of tags per mail address, '' if there is no donation at all.
+    """
+    tag_options = np.empty(4, dtype=object)
+    tag_options[:] = ['', ['Einzelspender/in'], ['Dauerspender/in'], ['Einzelspender/in', 'Dauerspender/in']]
+    tag_codes = (einzelspender_sum.to_numpy() > 0).astype(int) + 2 * (dauerspender_sum.to_numpy() > 0).astype(int)
+
+    return pd.Series(tag_options[tag_codes], index=dauerspender_sum.index, dtype=object)
+
+
+def normalize_mail_addresses(mail_addrs):
+    """Trims and lowercases the mail addresses column-wise and checks if they look valid.
+
+    Args:
+        mail_addrs ([series]): Mail addresses as exported, can contain missing values.
+
+    Returns:
+        [tuple]: Series with the normalized mail addresses and boolean series that is True for valid ones.
+    """
+    mail_addrs = mail_addrs.fillna('').astype(str).str.strip().str.lower()
+
+    return mail_addrs, mail_addrs.str.fullmatch(MAIL_PATTERN)
+
+
+def aggregate_per_mailadress(df_input, cols_for_chimp):
+    """Aggregates all given entries to one row per mail adress, indexed by the subscriber hash.
+        The mail addresses are normalized first, so that e.g. 'Jane@X.de' and 'jane@x.de ' count as one mail
+        address like in mailchimp, and invalid mail addresses are dropped. The entries are sorted once by subscriber
+        hash and donation id, so that the latest donation per mail address is the last row of its group. Exactly one
+        row per mail address is returned, even if donation ids tie.
+
+    Args:
+        df_input ([dataframe]): Cleaned dataframe from csv files.
+        cols_for_chimp ([dict]): List of columns that shall be used for mailchimp export.
+
+    Returns:
+        [dataframe]: Min and max donation id, number of recurring and single donations and the columns of the
+            latest donation per mail address, including the normalized mail address.
+    """
+    # Get Input Dataframe, sorting creates the only copy of the data
+    df_for_chimp = df_input[cols_for_chimp]
+    mail_addrs, is_valid = normalize_mail_addresses(df_for_chimp['email_address'])
+    n_invalid = int((~is_valid & (mail_addrs != '')).sum())
+    if n_invalid:
+        logger.warning("%d entries with an invalid mail address are not sent, e.g. %s.", n_invalid,
+                       mail_addrs[~is_valid & (mail_addrs != '')].iloc[0])
+    mail_addrs = mail_addrs[is_valid]
+    df_for_chimp = df_for_chimp[is_valid].assign(email_address=mail_addrs,
+                                                 subscriber_hash=hf.hash_strings(mail_addrs))
+    df_sorted = df_for_chimp.sort_values(['subscriber_hash', 'donation_id'], kind='stable')
     
+    # Reduziere auf einen Eintrag pro e-mail Adresse, the latest donation wins
+    df_latest = df_sorted.drop_duplicates('subscriber_hash', keep='last').set_index('subscriber_hash')
+    df_for_chimp_agg = df_sorted.groupby('subscriber_hash', sort=False).agg(
+        donation_id_min=('donation_id', 'min'),
+        donation_id_max=('donation_id', 'max'),
+        ist_dauerspender_sum=('ist_dauerspender', 'sum'),
+        ist_einzelspender_sum=('ist_einzelspender', 'sum'))
+
+    return pd.concat([df_for_chimp_agg, df_latest], axis=1)
+
+
+def combine_aggregates(df_agg_old, df_agg_new, order_by=('donation_id_max',)):
+    """Folds two results of aggregate_per_mailadress() into one, e.g. the results of two chunks of the same file.
+        For mail addresses in both, the row with the higher donation id wins, on ties the row from df_agg_new.
+
+    Args:
+        df_agg_old ([dataframe]): Aggregate of the entries processed so far, can be None.
+        df_agg_new ([dataframe]): Aggregate of the next entries.
+        order_by (tuple, optional): Columns that decide which row is the latest. Defaults to ('donation_id_max',).
+
+    Returns:
+        [dataframe]: Combined aggregate, indexed by the sorted subscriber hashes.
+    """
+    return fold_aggregates([df_agg_old, df_agg_new], order_by)
+
+
+def fold_aggregates(aggregates, order_by=('donation_id_max',)):
+    """Folds several results of aggregate_per_mailadress() into one with a single sort, see combine_aggregates().
+        For mail addresses in several of them, the row with the higher donation id wins, on ties the later one.
+
+    Args:
+        aggregates ([list]): Aggregates in the order the entries were processed, None entries are skipped.
+        order_by (tuple, optional): Columns that decide which row is the latest. Defaults to ('donation_id_max',).
+
+    Returns:
+        [dataframe]: Combined aggregate, indexed by the sorted subscriber hashes. None if there is no aggregate.
+    """
+    aggregates = [df_agg for df_agg in aggregates if df_agg is not None]
+    if len(aggregates) <= 1:
+        return aggregates[0] if aggregates else None
+    df_both = pd.concat(aggregates)
+    df_both.index.name = 'subscriber_hash'
+    df_both = df_both.reset_index().sort_values(['subscriber_hash'] + list(order_by), kind='stable')
+
+    df_combined = df_both.drop_duplicates('subscriber_hash', keep='last').set_index('subscriber_hash')
+    grouped = df_both.groupby('subscriber_hash', sort=False)
+    df_combined['donation_id_min'] = grouped['donation_id_min'].min()
+    df_combined['ist_dauerspender_sum'] = grouped['ist_dauerspender_sum'].sum()
+    df_combined['ist_einzelspender_sum'] = grouped['ist_einzelspender_sum'].sum()
+
+    return df_combined
+
+
+def add_spender_tags(df_agg, mode='', debug_name='process_to_one_mailadress'):
+    """Adds the tags to the result of aggregate_per_mailadress() and turns the subscriber hash into a column.
+        The given aggregate is modified in place.
+
+    Args:
+        df_agg ([dataframe]): Aggregate per mail address, indexed by the subscriber hash.
+        mode (str, optional): For debugging enter "DEBUG". Defaults to ''.
+        debug_name (str, optional): Name of the debug output. Defaults to 'process_to_one_mailadress'.
+
+    Returns:
+        [dataframe]: One row per mail address with the columns email_address, subscriber_hash and spender_tag.
+    """
+    df_agg.index.name = 'subscriber_hash'
+
+    # Fuege Tag hinzu, ob Dauerspender, Einzelspender oder beides 
+    df_agg.insert(4, 'spender_tag', get_spender_tags(df_agg['ist_dauerspender_sum'],
+                                                     df_agg['ist_einzelspender_sum']))
+    df_output = df_agg.reset_index()
+    # the mail address stays the first column, followed by its subscriber hash
+    df_output.insert(0, 'email_address', df_output.pop('email_address'))
+
     # DEBUG
-    hf.out_for_debug(df_output, 'from_twingle', mode)
-    
+    hf.out_for_debug(df_output, debug_name, mode)
+
     return df_output
 
 
@@ -167,37 +224,55 @@ def process_to_one_mailadress(df_input, cols_for_chimp, mode=''):
     Returns:
         [dataframe]: Returns the transmorfed dataframe.
     """
-    print(f"Start process_to_one_mailadress() ...")
-    # Get Input Dataframe 
-    df_for_chimp = df_input[cols_for_chimp].copy()
-    
-    # Reduziere auf einen Eintrag pro e-mail Adresse
-    df_for_chimp_agg = df_for_chimp.groupby('email_address').agg({
-    'donation_id': ['min','max'], 'ist_dauerspender': 'sum', 'ist_einzelspender':'sum'})
-    df_for_chimp_agg.columns = ["_".join(x) for x in df_for_chimp_agg.columns.ravel()]
-    df_for_chimp_agg = df_for_chimp_agg.reset_index()
-    
-    # Fuege Tag hinzu, ob Dauerspender, Einzelspender oder beides 
-    df_for_chimp_agg['spender_tag'] = df_for_chimp_agg.apply(lambda x: 
-            ['Einzelspender/in'] if ((x['ist_dauerspender_sum'] == 0) & (x['ist_einzelspender_sum'] > 0)) else
-                (['Dauerspender/in'] if ((x['ist_dauerspender_sum'] > 0) & (x['ist_einzelspender_sum'] == 0)) else
-                    (['Einzelspender/in', 'Dauerspender/in'] if ((x['ist_dauerspender_sum'] > 0) & (x['ist_einzelspender_sum'] > 0)) else '' ) )
-            , axis=1)
-    
-    # Combine Data
-    df_for_chimp_out = pd.merge(df_for_chimp_agg, df_for_chimp
-                            ,  how='left'
-                            , left_on=['email_address','donation_id_max']
-                            , right_on = ['email_address','donation_id'])
-    
-    # perpare outputs
-    df_output = df_for_chimp_out
-    
+    logger.debug("Start process_to_one_mailadress() ...")
+    df_for_chimp_agg = aggregate_per_mailadress(df_input, cols_for_chimp)
+
+    return add_spender_tags(df_for_chimp_agg, mode)
+
+
+def aggregate_chunks_per_mailadress(chunks, transform, cols_for_chimp, mode=''):
+    """Streaming version of transform() and aggregate_per_mailadress().
+        Every chunk is transformed and folded into an aggregate per mail address right away, so the memory needed
+        is bounded by the number of unique mail addresses and the chunk size, not by the number of donations.
+
+    Args:
+        chunks ([iterator]): Dataframes with consecutive parts of the raw csv file.
+        transform ([function]): Source transform, see src.sources.get_transform().
+        cols_for_chimp ([dict]): List of columns that shall be used for mailchimp export.
+        mode (str, optional): For debugging enter "DEBUG", the combined aggregate is written once instead of the
+            output of the transform per chunk. Defaults to ''.
+
+    Returns:
+        [dataframe]: Same result as aggregate_per_mailadress() on the whole transformed file.
+    """
+    logger.debug("Start aggregate_chunks_per_mailadress() ...")
+    df_agg = None
+    # aggregates of the chunks that are not folded into df_agg yet
+    buffered = []
+    n_buffered = 0
+    n_rows = 0
+    for df_chunk in mt.METRICS.iter_stage('load', chunks):
+        n_rows += len(df_chunk)
+        with mt.METRICS.stage('transform', len(df_chunk), logging.DEBUG) as stage:
+            # every chunk would overwrite the debug output of the previous one
+            df_clean = transform(df_chunk)
+            stage['rows_out'] = len(df_clean)
+        with mt.METRICS.stage('dedupe', len(df_clean), logging.DEBUG):
+            buffered.append(aggregate_per_mailadress(df_clean, cols_for_chimp))
+            n_buffered += len(buffered[-1])
+            # folding re-sorts the whole aggregate, so it waits until the buffer is as large as the aggregate: every
+            # row is sorted a logarithmic number of times and the buffer at most doubles the memory
+            if df_agg is None or n_buffered >= len(df_agg):
+                df_agg = fold_aggregates([df_agg] + buffered)
+                buffered, n_buffered = [], 0
+    with mt.METRICS.stage('dedupe', n_buffered, logging.DEBUG):
+        df_agg = fold_aggregates([df_agg] + buffered)
+    logger.info("Folded %d rows into %d mail addresses.", n_rows, len(df_agg))
+
     # DEBUG
-    hf.out_for_debug(df_output, 'process_to_one_mailadress', mode)
+    hf.out_for_debug(df_agg, 'aggregate_chunks_per_mailadress', mode)
 
-    
-    return df_output
+    return df_agg
 
 
 def process_to_mailchimp(df_input, col_map, out_fname='import_into_mailchimp.csv', mode=''):
@@ -212,10 +287,13 @@ def process_to_mailchimp(df_input, col_map, out_fname='import_into_mailchimp.csv
 
     Returns:
         [dataframe]: Dataframe with mailchimp compatible form and all relevant information for creating mailchimp contacts.
+            Indexed by the subscriber hash if the input has the column subscriber_hash.
     """
-    print(f"Start process_to_mailchimp() ...")
-    # Get Input Dataframe 
+    logger.debug("Start process_to_mailchimp() ...")
+    # Get Input Dataframe, the subscriber hash is the key of all requests to mailchimp
     df_mailchimp_wip = df_input.copy()
+    if 'subscriber_hash' in df_mailchimp_wip.columns:
+        df_mailchimp_wip = df_mailchimp_wip.set_index('subscriber_hash')
 
     # get output columns
     output_cols = []
@@ -240,7 +318,88 @@ def process_to_mailchimp(df_input, col_map, out_fname='import_into_mailchimp.csv
     return df_output
 
 
-def send_entries_to_mailchimp(df_to_mc, list_id, mc_api_key, server):
+def get_entry_from_row(row):
+    """Extracts the mail address, the merge fields and the tags from one row of the mailchimp dataframe.
+
+    Args:
+        row ([series]): One row of the dataframe returned by process_to_mailchimp().
+
+    Returns:
+        [tuple]: Mail address, dict with merge fields and list of tags.
+    """
+    # Get info from entry
+    mail_adress = row.iloc[0]
+    first_name = row.iloc[1]
+    last_name = row.iloc[2]
+    address_dict = row.iloc[4]
+    phone = row.iloc[5]
+    tags = row.iloc[6]
+
+    # mapping object for api to parse input data from the entry
+    merged_fields = {"FNAME":first_name, "LNAME":last_name, "ADDRESS":address_dict, "PHONE":phone}
+
+    return mail_adress, merged_fields, list(tags) if tags else []
+
+
+def get_client(mc_api_key, server, host='', max_workers=0, rate_limit=0.0, max_retries=rs.MAX_RETRIES,
+               session=None):
+    """Creates the client of the senders, with retries and a circuit breaker. With max_workers the client can be
+        shared by that many threads, its requests in flight shrink when mailchimp throttles and grow back up to
+        max_workers.
+
+    Args:
+        mc_api_key ([str]): Mailchimp API Key. Needed for communication.
+        server ([str]): Mailchimp Server, first part of the URL once logged in.
+        host (str, optional): Base URL of the API, used to point the client to a local stand-in server. Defaults to ''.
+        max_workers (int, optional): Maximal number of requests in flight, 0 for a client used by one thread.
+            Defaults to 0.
+        rate_limit (float, optional): Maximal number of requests per second, only used with max_workers.
+            Defaults to 0.0.
+        max_retries (int, optional): Retries of a request on throttling or server errors. Defaults to rs.MAX_RETRIES.
+        session (Session, optional): Session from hf.get_session() that is reused. Defaults to None.
+
+    Returns:
+        [Client]: Configured client object from mailchimp.
+    """
+    if not max_workers:
+        return hf.get_mailchimp_client(mc_api_key, server, host, retry_policy=rs.RetryPolicy(max_retries),
+                                       circuit_breaker=rs.CircuitBreaker(), session=session)
+
+    return hf.get_mailchimp_client(mc_api_key, server, host, pool_size=max_workers,
+                                   rate_limiter=cs.TokenBucket(rate_limit), retry_policy=rs.RetryPolicy(max_retries),
+                                   circuit_breaker=rs.CircuitBreaker(),
+                                   concurrency=rs.AdaptiveConcurrency(min(max_workers, cs.MAX_CONNECTIONS)),
+                                   session=session)
+
+
+def share_client(list_id, mc_api_key, server, send_mode='serial', send_opts=None):
+    """Creates the client and, with prefetch, loads the audience once, so that several calls of a sender, e.g. one
+        per slice of a journal, share the connections, the rate limit, the circuit breaker and the audience.
+
+    Args:
+        list_id ([str]): ID of the list where the entries should be added.
+        mc_api_key ([str]): Mailchimp API Key. Needed for communication.
+        server ([str]): Mailchimp Server, first part of the URL once logged in.
+        send_mode (str, optional): Sender that is used, see get_sender(). Defaults to 'serial'.
+        send_opts (dict, optional): Keyword arguments for the sender. Defaults to None.
+
+    Returns:
+        [dict]: Keyword arguments for the sender with the client and the audience.
+    """
+    send_opts = dict(send_opts or {})
+    if send_opts.get('client') is None:
+        max_workers = send_opts.get('max_workers', cs.MAX_CONNECTIONS) if send_mode == 'concurrent' else 0
+        send_opts['client'] = get_client(mc_api_key, server, send_opts.get('host', ''), max_workers,
+                                         send_opts.get('rate_limit', 10.0),
+                                         send_opts.get('max_retries', rs.MAX_RETRIES), send_opts.get('session'))
+    if send_opts.pop('prefetch', False) and send_opts.get('audience') is None:
+        send_opts['audience'] = hf.get_audience(send_opts['client'], list_id)
+
+    return send_opts
+
+
+def send_entries_to_mailchimp(df_to_mc, list_id, mc_api_key, server, host='', prefetch=False,
+                              max_retries=rs.MAX_RETRIES, session=None, audience=None, client=None):
     """Function that sends all entries within a dataframe to mailchimp.
 
     Args:
@@ -248,33 +407,193 @@ def send_entries_to_mailchimp(df_to_mc, list_id, mc_api_key, server):
             Schema: Email Address,	First Name,	Last Name,	Address,	Phone,	Tags
         mc_api_key ([str]): [description]
         server ([str]): [description]
+        host (str, optional): Base URL of the API, used to point the client to a local stand-in server. Defaults to ''.
+        prefetch (bool, optional): Load all members of the list first and send only the requests that are needed
+            for each entry. Defaults to False.
+        max_retries (int, optional): Retries of a request on throttling or server errors. Defaults to rs.MAX_RETRIES.
+        session (Session, optional): Session from hf.get_session() that is reused. Defaults to None.
+        audience (dict, optional): Members of the list loaded before by hf.get_audience(), used instead of
+            loading them again. Is updated with the sent data. Defaults to None.
+        client (Client, optional): Client from get_client() that is used instead of a new one. Defaults to None.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all entries that could not be updated.
     """
-    print(f"Start send_entries_to_mailchimp() ...")
+    logger.debug("Start send_entries_to_mailchimp() ...")
     
+    # configure mailchimp client
+    client = client or get_client(mc_api_key, server, host, max_retries=max_retries, session=session)
+    if audience is None and prefetch:
+        audience = hf.get_audience(client, list_id)
+    mail_hashes = hf.get_subscriber_hashes(df_to_mc)
+
+    errors = {}
     for index, row in df_to_mc.iterrows():
         # Get info from entry
-        mail_adress = row[0]
-        first_name = row[1]
-        last_name = row[2]
-        address = row[3]
-        address_dict = row[4]
-        phone = row[5]
-        tags = row[6]
-
-        # configure mailchimp client
-        client = MailchimpMarketing.Client()
-        client.set_config({
-            "api_key": mc_api_key,
-            "server": server
-        })
-        
-        # mapping object for api to parse input data from the entry
-        merged_fields = {"FNAME":first_name, "LNAME":last_name, "ADDRESS":address_dict, "PHONE":phone}
-        print(f"Infos zur Mail adresse: {merged_fields}")
+        mail_adress, merged_fields, tags = get_entry_from_row(row)
+        mail_h = mail_hashes[mail_adress]
+        logger.debug("Infos zur Mail adresse: %s", merged_fields)
 
         # send data to mailchimp
+        if audience is not None:
+            entry_errors = hf.sync_entry(client, list_id, mail_adress, merged_fields, tags, audience, mail_h)
+        else:
+            hf.create_new_entry(client, list_id, mail_adress, merged_fields, tags)
+            entry_errors = hf.update_existing_entry(client, list_id, mail_adress, merged_fields, tags, mail_h)
+        if entry_errors:
+            errors[mail_adress] = rs.join_errors(entry_errors)
+    logger.info("Sent %d of %d entries to mailchimp.", len(df_to_mc) - len(errors), len(df_to_mc))
+
+    return errors
+
+
+def send_entries_to_mailchimp_concurrent(df_to_mc, list_id, mc_api_key, server, host='',
+                                         max_workers=cs.MAX_CONNECTIONS, rate_limit=10.0, prefetch=False,
+                                         max_retries=rs.MAX_RETRIES, session=None, audience=None, client=None):
+    """Function that sends all entries within a dataframe to mailchimp with several requests in flight.
+        All threads share one client with a pooled session, every request is subject to a token bucket rate limit.
+
+    Args:
+        df_to_mc ([dataframe]): Dataframe with entries that shall be sent to mailchimp.
+            Schema: Email Address,	First Name,	Last Name,	Address,	Phone,	Tags
+        list_id ([str]): ID of the list where the entries should be added.
+        mc_api_key ([str]): Mailchimp API Key. Needed for communication.
+        server ([str]): Mailchimp Server, first part of the URL once logged in.
+        host (str, optional): Base URL of the API, used to point the client to a local stand-in server. Defaults to ''.
+        max_workers (int, optional): Maximal number of entries in flight, capped at 10 by mailchimp.
+            Defaults to cs.MAX_CONNECTIONS.
+        rate_limit (float, optional): Maximal number of requests per second. Defaults to 10.0.
+        prefetch (bool, optional): Load all members of the list first and send only the requests that are needed
+            for each entry. Defaults to False.
+        max_retries (int, optional): Retries of a request on throttling or server errors. Defaults to rs.MAX_RETRIES.
+        session (Session, optional): Session from hf.get_session() that is reused, it should keep max_workers
+            connections open. Defaults to None.
+        audience (dict, optional): Members of the list loaded before by hf.get_audience(), used instead of
+            loading them again. Is updated with the sent data. Defaults to None.
+        client (Client, optional): Client from get_client() with max_workers, used instead of a new one.
+            Defaults to None.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all entries that could not be updated.
+    """
+    logger.debug("Start send_entries_to_mailchimp_concurrent() ...")
+    client = client or get_client(mc_api_key, server, host, max_workers, rate_limit, max_retries, session)
+    if audience is None and prefetch:
+        audience = hf.get_audience(client, list_id)
+    mail_hashes = hf.get_subscriber_hashes(df_to_mc)
+
+    def send_entry(mail_adress, merged_fields, tags):
+        mail_h = mail_hashes[mail_adress]
+        if audience is not None:
+            return hf.sync_entry(client, list_id, mail_adress, merged_fields, tags, audience, mail_h)
         hf.create_new_entry(client, list_id, mail_adress, merged_fields, tags)
-        hf.update_existing_entry(client, list_id, mail_adress, merged_fields, tags)
+        return hf.update_existing_entry(client, list_id, mail_adress, merged_fields, tags, mail_h)
+
+    entries = [get_entry_from_row(row) for index, row in df_to_mc.iterrows()]
+
+    return cs.send_concurrently(entries, send_entry, max_workers)
+
+
+def send_entries_to_mailchimp_bulk(df_to_mc, list_id, mc_api_key, server, host='', poll_interval=2.0,
+                                   max_retries=rs.MAX_RETRIES, session=None, client=None):
+    """Function that sends all entries within a dataframe to mailchimp using batch operations.
+        Members are created or updated in chunks of 500 via the batch subscribe endpoint, afterwards
+        all tags are set with one batch request whose status is polled until it is finished.
+
+    Args:
+        df_to_mc ([dataframe]): Dataframe with entries that shall be sent to mailchimp.
+            Schema: Email Address,	First Name,	Last Name,	Address,	Phone,	Tags
+        list_id ([str]): ID of the list where the entries should be added.
+        mc_api_key ([str]): Mailchimp API Key. Needed for communication.
+        server ([str]): Mailchimp Server, first part of the URL once logged in.
+        host (str, optional): Base URL of the API, used to point the client to a local stand-in server. Defaults to ''.
+        poll_interval (float, optional): Seconds to wait between two status requests of a batch. Defaults to 2.0.
+        max_retries (int, optional): Retries of a request on throttling or server errors. Defaults to rs.MAX_RETRIES.
+        session (Session, optional): Session from hf.get_session() that is reused. Defaults to None.
+        client (Client, optional): Client from get_client() that is used instead of a new one. Defaults to None.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all entries that could not be sent.
+    """
+    logger.debug("Start send_entries_to_mailchimp_bulk() ...")
+    client = client or get_client(mc_api_key, server, host, max_retries=max_retries, session=session)
+
+    members = []
+    mail_tags = {}
+    for index, row in df_to_mc.iterrows():
+        mail_adress, merged_fields, tags = get_entry_from_row(row)
+        members.append({"email_address": mail_adress, "status": "subscribed", "merge_fields": merged_fields})
+        mail_tags[mail_adress] = tags
+
+    # create or update members, tags are only sent for members that were accepted
+    errors = mcb.batch_upsert_members(client, list_id, members)
+    mail_tags = {mail_adress: tags for mail_adress, tags in mail_tags.items() if mail_adress not in errors}
+    tag_errors = mcb.batch_add_tags(client, list_id, mail_tags, poll_interval,
+                                    mail_hashes=hf.get_subscriber_hashes(df_to_mc))
+    for mail_adress, error in tag_errors.items():
+        errors[mail_adress] = rs.join_errors([error], "Error on updating tags: ")
+
+    n_pending = 0
+    for mail_adress, error in errors.items():
+        if rs.is_pending(error):
+            n_pending += 1
+        else:
+            logger.warning("Error on mail address %s: %s", mail_adress, error)
+    logger.info("Sent %d of %d entries to mailchimp, the tags of %d more are pending.", len(members) - len(errors),
+                len(members), n_pending)
+
+    return errors
+
+
+def get_sender(send_mode='serial'):
+    """Returns the function that sends the entries to mailchimp for the given mode.
+
+    Args:
+        send_mode (str, optional): One of 'serial', 'bulk' or 'concurrent'. Defaults to 'serial'.
+
+    Returns:
+        [function]: Sender with the signature (df_to_mc, list_id, mc_api_key, server, **send_opts).
+    """
+    senders = {
+        'serial': send_entries_to_mailchimp,
+        'bulk': send_entries_to_mailchimp_bulk,
+        'concurrent': send_entries_to_mailchimp_concurrent,
+    }
+    if send_mode not in senders:
+        raise ValueError(f"Unknown send mode '{send_mode}', use one of {list(senders)}.")
+
+    return senders[send_mode]
+
+
+def send_changed_entries(df_to_mc, list_id, mc_api_key, server, send_mode='serial',
+                         state_path=ss.DEFAULT_STATE_PATH, **send_opts):
+    """Sends only the entries that are new or changed since the last run to mailchimp.
+        Every entry is compared to the fingerprint of its merge fields and tags stored in the local sync state.
+        After sending, the fingerprints of all entries sent without errors are stored.
+
+    Args:
+        df_to_mc ([dataframe]): Dataframe with entries that shall be sent to mailchimp.
+        list_id ([str]): ID of the list where the entries should be added.
+        mc_api_key ([str]): Mailchimp API Key. Needed for communication.
+        server ([str]): Mailchimp Server, first part of the URL once logged in.
+        send_mode (str, optional): Sender that is used, see get_sender(). Defaults to 'serial'.
+        state_path (str, optional): Path of the SQLite file with the sync state. Defaults to ss.DEFAULT_STATE_PATH.
+        **send_opts: Additional keyword arguments for the sender.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all entries that could not be sent.
+    """
+    conn = ss.open_state(state_path)
+    try:
+        df_changed, pending = ss.filter_changed(conn, list_id, df_to_mc, get_entry_from_row)
+        if df_changed.empty:
+            return {}
+        errors = get_sender(send_mode)(df_changed, list_id, mc_api_key, server, **send_opts)
+        ss.record_synced(conn, list_id, pending, errors)
+    finally:
+        conn.close()
+
+    return errors
 
 
 def clean_up(fname, fname_processed, timest, data_path = './data/', folder_name='processed'):
@@ -288,10 +607,23 @@ def clean_up(fname, fname_processed, timest, data_path = './data/', folder_name=
         folder_name (str, optional): Name of the subfolder within the data folder that is used for archiving. 
             Defaults to 'processed'.
     """
-    print(f"Start send_entries_to_maiclean_uplchimp() ...")
+    logger.debug("Start clean_up() ...")
+    archive_files([fname, fname_processed], timest, data_path, folder_name)
+
+
+def archive_files(fnames, timest, data_path = './data/', folder_name='processed'):
+    """Moves the given files to the folder 'processed' into a time folder.
+
+    Args:
+        fnames ([list]): Names of the files within the data folder.
+        timest ([str]): Timestamp of the run, used as name of the time folder.
+        data_path (str, optional): Path to the data folder. Defaults to './data/'.
+        folder_name (str, optional): Name of the subfolder within the data folder that is used for archiving. 
+            Defaults to 'processed'.
+    """
     path = data_path+folder_name+'/'+timest +'/'
     if not os.path.exists(path):
         os.mkdir(path)
     
-    shutil.move(data_path+fname, path+fname)
-    shutil.move(data_path+fname_processed, path+fname_processed)
\ No newline at end of file
+    for fname in fnames:
+        shutil.move(data_path+fname, path+fname)
@@ -0,0 +1,244 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Responses that are worth another try: throttling and temporary server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Client errors that are not final, because they concern the account or the connection and not the contact
+NOT_FINAL_STATUS_CODES = (401, 403, 408, 429)
+MAX_RETRIES = 5
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open for good."""
+
+
+class SendError(str):
+    """Error message of a contact that could not be sent, used like a string. Errors of requests that mailchimp
+        rejected with a client error are final, see is_final(): sending the contact again gives the same error.
+
+    Args:
+        text ([str]): Error message.
+        status_code (int, optional): Status of the response that rejected the contact, None if there was none.
+            Defaults to None.
+        pending (bool, optional): Mailchimp accepted the request but has not processed it yet, e.g. a batch request
+            that did not finish in time. Defaults to False.
+    """
+
+    def __new__(cls, text, status_code=None, pending=False):
+        error = super().__new__(cls, text)
+        error.status_code = status_code
+        error.pending = pending
+
+        return error
+
+
+def is_pending(error):
+    """Returns True if the error belongs to a request that mailchimp accepted but has not processed yet."""
+    return getattr(error, 'pending', False)
+
+
+def is_final(error):
+    """Returns True if the error is a rejection of the contact by mailchimp, e.g. an invalid mail address, which no
+        retry can fix.
+    """
+    status_code = getattr(error, 'status_code', None)
+
+    return status_code is not None and 400 <= status_code < 500 and status_code not in NOT_FINAL_STATUS_CODES
+
+
+def join_errors(errors, prefix=''):
+    """Joins the error messages of one contact into one SendError, which is final or pending only if all of them
+        are.
+
+    Args:
+        errors ([list]): Error messages, strings or SendErrors.
+        prefix (str, optional): Text put in front of the joined messages. Defaults to ''.
+
+    Returns:
+        [SendError]: Joined error message.
+    """
+    errors = list(errors)
+    status_codes = [getattr(error, 'status_code', None) for error in errors]
+    if len(set(status_codes)) == 1 or all(is_final(error) for error in errors):
+        status_code = status_codes[0]
+    else:
+        status_code = None
+
+    return SendError(prefix + '; '.join(errors), status_code, all(is_pending(error) for error in errors))
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for failed requests.
+
+    Args:
+        max_retries (int, optional): Retries after the first attempt. Defaults to MAX_RETRIES.
+        base_delay (float, optional): Upper bound of the first delay in seconds, doubled with every retry.
+            Defaults to 0.5.
+        max_delay (float, optional): Upper bound of every delay in seconds. Defaults to 30.0.
+    """
+
+    def __init__(self, max_retries=MAX_RETRIES, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt, retry_after=None):
+        """Returns the seconds to wait before the next attempt.
+
+        Args:
+            attempt ([int]): Number of the failed attempt, starting with 0.
+            retry_after ([str], optional): Value of the Retry-After header, which is honored if given in seconds.
+                Defaults to None.
+
+        Returns:
+            [float]: Seconds to wait.
+        """
+        try:
+            return min(float(retry_after), self.max_delay)
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Pauses all requests when too many of the recent requests failed.
+        The first trips pause all callers for the cooldown, afterwards requests are tried again. Once tripped
+        max_trips times, the breaker stays open and every request fails right away.
+
+    Args:
+        window (int, optional): Number of recent requests the error rate is computed on. Defaults to 50.
+        threshold (float, optional): Error rate that trips the breaker. Defaults to 0.5.
+        min_calls (int, optional): Requests needed in the window before the breaker can trip. Defaults to 10.
+        cooldown (float, optional): Seconds all requests are paused after a trip. Defaults to 30.0.
+        max_trips (int, optional): Trips after which the breaker stays open. Defaults to 3.
+    """
+
+    def __init__(self, window=50, threshold=0.5, min_calls=10, cooldown=30.0, max_trips=3):
+        self.outcomes = deque(maxlen=window)
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+        self.trips = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Blocks while the breaker is open, raises CircuitOpenError if it is open for good."""
+        with self.lock:
+            if self.trips >= self.max_trips:
+                raise CircuitOpenError(f"Circuit breaker is open after {self.trips} trips, request not sent.")
+            wait = self.open_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def record(self, success):
+        """Records the outcome of one request and trips the breaker if the error rate is too high."""
+        with self.lock:
+            self.outcomes.append(success)
+            if len(self.outcomes) < self.min_calls:
+                return
+            error_rate = 1 - sum(self.outcomes) / len(self.outcomes)
+            if error_rate >= self.threshold:
+                self.trips += 1
+                self.open_until = time.monotonic() + self.cooldown
+                self.outcomes.clear()
+                action = (f"pausing for {self.cooldown:.0f}s" if self.trips < self.max_trips
+                          else "stopping all requests")
+                logger.warning("Circuit breaker tripped (%d/%d): %.0f%% of the recent requests failed, %s.",
+                               self.trips, self.max_trips, error_rate * 100, action)
+
+
+class AdaptiveConcurrency:
+    """Limits the requests in flight and adapts the limit to the server (additive increase, multiplicative decrease).
+        The limit is halved when the server throttles and grows by one after a full limit of successful requests.
+
+    Args:
+        max_limit ([int]): Upper bound of the requests in flight.
+        min_limit (int, optional): Lower bound of the requests in flight. Defaults to 1.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Blocks until a request can be sent within the current limit."""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            now = time.monotonic()
+            # requests in flight are throttled together, count them as one signal
+            if now - self.last_decrease < 1.0:
+                return
+            self.last_decrease = now
+            self.successes = 0
+            self.limit = max(self.min_limit, self.limit // 2)
+            logger.info("Throttled by mailchimp, reducing the requests in flight to %d.", self.limit)
+
+
+def get_dead_letter_file(dead_letter_path, fname, timest):
+    """Returns the path of the dead letter file for the given input file and creates its folder.
+
+    Args:
+        dead_letter_path ([str]): Folder of the dead letter files.
+        fname ([str]): Name of the input file, or a name for the combined files.
+        timest ([str]): Timestamp of the run.
+
+    Returns:
+        [str]: Path of the dead letter file.
+    """
+    os.makedirs(dead_letter_path, exist_ok=True)
+    stem = fname[:-4] if fname.endswith('.csv') else fname
+
+    return os.path.join(dead_letter_path, f"{stem}_{timest}_failed.csv")
+
+
+def write_dead_letter(df_to_mc, errors, dead_letter_file):
+    """Appends all entries that could not be sent to the dead letter file, together with their error message.
+        Entries whose errors are pending, see SendError, are left out.
+
+    Args:
+        df_to_mc ([dataframe]): Dataframe with the entries that were sent to mailchimp, mail address first.
+        errors ([dict]): Mapping of mail address to error message.
+        dead_letter_file ([str]): Path of the dead letter file.
+    """
+    # pending contacts are not failed, they are sent again by the next run with a journal
+    n_pending = sum(is_pending(error) for error in errors.values())
+    if n_pending:
+        logger.warning("%d entries are pending in mailchimp and not written to %s.", n_pending, dead_letter_file)
+    errors = {mail_addr: error for mail_addr, error in errors.items() if not is_pending(error)}
+    if not errors:
+        return
+    mail_addrs = df_to_mc.iloc[:, 0]
+    df_failed = df_to_mc[mail_addrs.isin(errors.keys())].copy()
+    df_failed['error'] = df_failed.iloc[:, 0].map(errors)
+    df_failed.to_csv(dead_letter_file, mode='a', index=False, header=not os.path.exists(dead_letter_file))
+    logger.warning("%d entries that could not be sent were written to %s.", len(df_failed), dead_letter_file)
@@ -0,0 +1,33 @@
+# Columns that are used from the exports and the dtypes they are read with.
+# Postal codes are read as strings, so that leading zeros are kept and no '.0' is appended.
+# Ids and flags are nullable integers, so that a missing value does not fail the load, countries and states are
+# categoricals.
+
+FUNDRAISINGBOX_SCHEMA = {
+    'donation_id': 'Int64',
+    'email_address': str,
+    'first_name': str,
+    'last_name': str,
+    'phone': str,
+    'address': str,
+    'city': str,
+    'state': 'category',
+    'post_code': str,
+    'country': 'category',
+    'by_recurring': 'Int8',
+    'donation_meta_info': str,
+}
+
+TWINGLE_SCHEMA = {
+    'trx_id': 'Int64',
+    'user_email': str,
+    'user_firstname': str,
+    'user_lastname': str,
+    'user_telephone': str,
+    'user_street': str,
+    'user_city': str,
+    'user_postal_code': str,
+    'user_country': 'category',
+    'recurring': 'Int8',
+    'newsletter': 'Int8',
+}
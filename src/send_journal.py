@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from . import resilience as rs
+
+DEFAULT_JOURNAL_PATH = './data/journal/'
+
+logger = logging.getLogger(__name__)
+
+
+def get_file_hash(fpath, block_size=1 << 20):
+    """Computes the MD5 hash of the content of a file.
+
+    Args:
+        fpath ([str]): Path of the file.
+        block_size (int, optional): Bytes read at once. Defaults to 1 MiB.
+
+    Returns:
+        [str]: MD5 hash of the file content.
+    """
+    file_hash = hashlib.md5()
+    with open(fpath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def get_journal_file(journal_path, fnames, data_path='./data/'):
+    """Returns the journal file for the given input files, keyed by their names and content hashes.
+        A rerun with unchanged input files gets the same journal, a changed file gets a new one.
+
+    Args:
+        journal_path ([str]): Folder of the journals.
+        fnames ([list]): Names of the input files within the data folder.
+        data_path (str, optional): Path to the data folder. Defaults to './data/'.
+
+    Returns:
+        [str]: Path of the journal file.
+    """
+    key = hashlib.md5()
+    for fname in sorted(fnames):
+        key.update(f"{fname}:{get_file_hash(data_path + fname)}\n".encode())
+    name = fnames[0][:-4] if len(fnames) == 1 else 'combined'
+    os.makedirs(journal_path, exist_ok=True)
+
+    return os.path.join(journal_path, f"{name}_{key.hexdigest()[:16]}.jsonl")
+
+
+def read_journal(journal_file):
+    """Reads a journal.
+
+    Args:
+        journal_file ([str]): Path of the journal file.
+
+    Returns:
+        [tuple]: Set of the acknowledged mail addresses and whether the journal is marked as complete.
+    """
+    acknowledged = set()
+    complete = False
+    if not os.path.exists(journal_file):
+        return acknowledged, complete
+    with open(journal_file, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line can be cut off if a run died while writing it
+                continue
+            if record.get('complete'):
+                complete = True
+            elif 'email' in record:
+                acknowledged.add(record['email'])
+
+    return acknowledged, complete
+
+
+def append_acknowledged(journal_file, mail_addrs, status='sent'):
+    """Appends the given mail addresses as acknowledged to the journal.
+
+    Args:
+        journal_file ([str]): Path of the journal file.
+        mail_addrs ([list]): Mail addresses that were confirmed by mailchimp.
+        status (str, optional): Why the contact needs no further sending. Defaults to 'sent'.
+    """
+    ts = datetime.now().isoformat(timespec='seconds')
+    with open(journal_file, 'a', encoding='utf-8') as f:
+        f.writelines(json.dumps({"email": mail_addr, "status": status, "ts": ts}) + '\n' for mail_addr in mail_addrs)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def mark_complete(journal_file):
+    """Marks the journal as complete, i.e. all contacts of its input files were acknowledged."""
+    with open(journal_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"complete": True, "ts": datetime.now().isoformat(timespec='seconds')}) + '\n')
+
+
+def is_complete(journal_file):
+    """Returns whether the journal is marked as complete."""
+    return read_journal(journal_file)[1]
+
+
+def send_with_journal(send_entries, df_to_mc, journal_file, batch_size=500):
+    """Sends the entries in batches and journals every acknowledged contact right after its batch.
+        Contacts already acknowledged in the journal are skipped, so a rerun continues where the last run stopped.
+        Contacts that mailchimp rejected for good, see rs.is_final(), are journaled as rejected and do not keep the
+        journal from being complete.
+
+    Args:
+        send_entries ([function]): Function that sends a dataframe of entries and returns a mapping of
+            mail address to error message.
+        df_to_mc ([dataframe]): Dataframe with entries that shall be sent to mailchimp, mail address first.
+        journal_file ([str]): Path of the journal file.
+        batch_size (int, optional): Entries sent between two journal writes. Defaults to 500.
+
+    Returns:
+        [dict]: Mapping of mail address to error message for all entries that could not be sent.
+    """
+    acknowledged, complete = read_journal(journal_file)
+    if complete:
+        logger.info("Journal %s is complete, nothing to send.", journal_file)
+        return {}
+    mail_addrs = df_to_mc.iloc[:, 0]
+    df_pending = df_to_mc[~mail_addrs.isin(acknowledged)]
+    logger.info("Journal: %d of %d entries were already sent.", len(df_to_mc) - len(df_pending), len(df_to_mc))
+
+    errors = {}
+    for start in range(0, len(df_pending), batch_size):
+        df_batch = df_pending.iloc[start:start + batch_size]
+        batch_errors = send_entries(df_batch)
+        append_acknowledged(journal_file, [mail_addr for mail_addr in df_batch.iloc[:, 0]
+                                           if mail_addr not in batch_errors])
+        rejected = [mail_addr for mail_addr, error in batch_errors.items() if rs.is_final(error)]
+        if rejected:
+            append_acknowledged(journal_file, rejected, status='rejected')
+        errors.update(batch_errors)
+
+    if all(rs.is_final(error) for error in errors.values()):
+        mark_complete(journal_file)
+
+    return errors
@@ -0,0 +1,153 @@
+"""Registry of the donation platforms whose exports are processed.
+
+Every platform is declared once as a Source: which files are its exports, how its columns map to the columns of the
+pipeline, which rows agreed to the newsletter, where the address is and which donations are recurring. register()
+compiles the declaration into a transform that works on whole columns and only copies the columns that are used.
+Adding a platform means adding its schema to src/schemas.py and a register() call below.
+"""
+import json
+import logging
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from . import helper_functions as hf
+from . import process_files as pf
+from . import schemas
+
+logger = logging.getLogger(__name__)
+
+# Columns every transform returns, the input of pf.aggregate_per_mailadress()
+OUTPUT_COLUMNS = ['email_address', 'first_name', 'last_name', 'phone', 'donation_id', 'address_for_chimp',
+                  'address_for_chimp_dict', 'ist_dauerspender', 'ist_einzelspender']
+
+# Rows without a value in column are dropped, the others are kept if the value equals value. With json_key the column
+# holds a json object and its entry json_key is compared, a missing entry counts as ''.
+Consent = namedtuple('Consent', ['column', 'value', 'json_key'], defaults=[None])
+
+# Columns of the address parts, None for parts the platform does not export, they are left empty
+Address = namedtuple('Address', ['street', 'city', 'state', 'post_code', 'country'])
+
+# One donation platform:
+#   name: used in the logs and for the source key 'is_<name>', e.g. 'is_twingle'
+#   file_pattern: substring of the names of its export files
+#   parse_env: environment variable that enables the platform, e.g. PARSE_TWNIG = "True"
+#   columns: mapping of the columns email_address, first_name, last_name, phone and donation_id to export columns
+#   consent, address: see Consent and Address
+#   recurring: column that is 1 for recurring donations
+#   fill_value: value for missing entries
+#   schema: columns and dtypes of the export for TYPED_LOAD, see src/schemas.py
+Source = namedtuple('Source', ['name', 'file_pattern', 'parse_env', 'columns', 'consent', 'address', 'recurring',
+                               'fill_value', 'schema'])
+
+# Registered platforms and their compiled transforms by source key, in the order they are processed
+SOURCES = {}
+TRANSFORMS = {}
+
+
+def get_consents(values, consent):
+    """Returns a boolean array that is True for the values that agree to the newsletter."""
+    if consent.json_key is None:
+        return np.asarray(values == consent.value, dtype=bool)
+    # exports repeat the same few meta infos, so every distinct one is parsed only once
+    codes, uniques = pd.factorize(values)
+    agreed = np.array([json.loads(meta_info).get(consent.json_key, '') == consent.value
+                       for meta_info in uniques.tolist()], dtype=bool)
+
+    return agreed[codes]
+
+
+def compile_transform(source):
+    """Compiles the declaration of a platform into its transform.
+
+    Args:
+        source ([Source]): Declaration of the platform.
+
+    Returns:
+        [function]: Transform with the signature (df_input, mode='') that returns a dataframe with the
+            OUTPUT_COLUMNS of all rows that agreed to the newsletter.
+    """
+    missing = set(OUTPUT_COLUMNS[:5]) - set(source.columns)
+    if missing:
+        raise ValueError(f"Source {source.name} does not map the columns {sorted(missing)}.")
+    address_cols = [col for col in source.address if col is not None]
+    used_cols = list(dict.fromkeys([source.consent.column, *source.columns.values(), *address_cols,
+                                    source.recurring]))
+    debug_name = f'from_{source.name.lower()}'
+
+    def transform(df_input, mode=''):
+        logger.debug("Start %s() ...", debug_name)
+        # only the used columns are copied and filled
+        df_used = df_input.loc[df_input[source.consent.column].notna(), used_cols]
+        df_used = pf.fill_missing(df_used, source.fill_value)
+        df_nl = df_used[get_consents(df_used[source.consent.column], source.consent)]
+
+        df_output = pd.DataFrame({col: df_nl[source_col] for col, source_col in source.columns.items()},
+                                 index=df_nl.index)
+        parts = [df_nl[col].astype(str) if col is not None else '' for col in source.address]
+        df_output['address_for_chimp'] = pf.build_address_string(*parts)
+        df_output['address_for_chimp_dict'] = pf.build_address_dicts(*parts)
+        df_output['ist_dauerspender'] = (df_nl[source.recurring] == 1).astype('int64')
+        df_output['ist_einzelspender'] = 1 - df_output['ist_dauerspender']
+
+        hf.out_for_debug(df_output, debug_name, mode)
+
+        return df_output[OUTPUT_COLUMNS]
+
+    return transform
+
+
+def register(source):
+    """Adds a platform to the registry and compiles its transform.
+
+    Returns:
+        [str]: Source key of the platform, e.g. 'is_twingle'.
+    """
+    if source.address.street is None:
+        raise ValueError(f"Source {source.name} needs a street column.")
+    what_file = f'is_{source.name}'
+    SOURCES[what_file] = source
+    TRANSFORMS[what_file] = compile_transform(source)
+
+    return what_file
+
+
+def get_source(what_file):
+    """Returns the declaration of the platform with the given source key, e.g. 'is_twingle'."""
+    if what_file not in SOURCES:
+        raise ValueError(f"Unknown source '{what_file}', use one of {list(SOURCES)}.")
+
+    return SOURCES[what_file]
+
+
+def get_transform(what_file):
+    """Returns the compiled transform of the platform with the given source key, e.g. 'is_twingle'."""
+    get_source(what_file)
+
+    return TRANSFORMS[what_file]
+
+
+register(Source(
+    name='FundraisingBox',
+    file_pattern='FundraisingBox',
+    parse_env='PARSE_FUND',
+    columns={'email_address': 'email_address', 'first_name': 'first_name', 'last_name': 'last_name',
+             'phone': 'phone', 'donation_id': 'donation_id'},
+    consent=Consent('donation_meta_info', '1', json_key='wants_newsletter'),
+    address=Address('address', 'city', 'state', 'post_code', 'country'),
+    recurring='by_recurring',
+    fill_value='',
+    schema=schemas.FUNDRAISINGBOX_SCHEMA,
+))
+
+register(Source(
+    name='twingle',
+    file_pattern='twingle',
+    parse_env='PARSE_TWNIG',
+    columns={'email_address': 'user_email', 'first_name': 'user_firstname', 'last_name': 'user_lastname',
+             'phone': 'user_telephone', 'donation_id': 'trx_id'},
+    consent=Consent('newsletter', 1),
+    address=Address('user_street', 'user_city', None, 'user_postal_code', 'user_country'),
+    recurring='recurring',
+    fill_value=' ',
+    schema=schemas.TWINGLE_SCHEMA,
+))
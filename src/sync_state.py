@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime
+from . import helper_functions as hf
+
+DEFAULT_STATE_PATH = './data/sync_state.sqlite'
+
+logger = logging.getLogger(__name__)
+
+
+def open_state(state_path=DEFAULT_STATE_PATH):
+    """Opens the local sync state store and creates its table if needed.
+
+    Args:
+        state_path (str, optional): Path of the SQLite file. Defaults to DEFAULT_STATE_PATH.
+
+    Returns:
+        [Connection]: Connection to the sync state store.
+    """
+    conn = sqlite3.connect(state_path)
+    conn.execute("""CREATE TABLE IF NOT EXISTS synced_contacts (
+                        list_id TEXT NOT NULL,
+                        subscriber_hash TEXT NOT NULL,
+                        fingerprint TEXT NOT NULL,
+                        synced_at TEXT NOT NULL,
+                        PRIMARY KEY (list_id, subscriber_hash))""")
+    conn.commit()
+
+    return conn
+
+
+def fingerprint_entry(merge_fields, tags):
+    """Computes a fingerprint of everything that is pushed to mailchimp for one contact.
+
+    Args:
+        merge_fields ([dict]): Merge fields of the contact.
+        tags ([list]): Tags of the contact.
+
+    Returns:
+        [str]: MD5 hash of the merge fields and the sorted tags.
+    """
+    content = json.dumps({"merge_fields": merge_fields, "tags": sorted(tags)}, sort_keys=True, default=str)
+
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def get_fingerprints(conn, list_id, subscriber_hashes):
+    """Loads the fingerprints last pushed for the given subscriber hashes.
+
+    Args:
+        conn ([Connection]): Connection to the sync state store.
+        list_id ([str]): ID of the mailchimp list.
+        subscriber_hashes ([list]): Subscriber hashes to look up.
+
+    Returns:
+        [dict]: Mapping of subscriber hash to fingerprint for all known contacts.
+    """
+    fingerprints = {}
+    subscriber_hashes = list(subscriber_hashes)
+    # stay below the maximal number of variables of a SQLite statement
+    for i in range(0, len(subscriber_hashes), 500):
+        chunk = subscriber_hashes[i:i + 500]
+        rows = conn.execute("SELECT subscriber_hash, fingerprint FROM synced_contacts "
+                            f"WHERE list_id = ? AND subscriber_hash IN ({','.join('?' * len(chunk))})",
+                            [list_id] + chunk)
+        fingerprints.update(dict(rows))
+
+    return fingerprints
+
+
+def filter_changed(conn, list_id, df_to_mc, get_entry):
+    """Removes all entries from the dataframe that were already pushed to mailchimp in exactly this form.
+
+    Args:
+        conn ([Connection]): Connection to the sync state store.
+        list_id ([str]): ID of the mailchimp list.
+        df_to_mc ([dataframe]): Dataframe with entries that shall be sent to mailchimp.
+        get_entry ([function]): Function that extracts mail address, merge fields and tags from a row.
+
+    Returns:
+        [tuple]: Dataframe with new or changed entries only and a mapping of mail address to
+            (subscriber hash, fingerprint) for these entries.
+    """
+    mail_hashes = hf.get_subscriber_hashes(df_to_mc)
+    current = {}
+    for index, row in df_to_mc.iterrows():
+        mail_addr, merge_fields, tags = get_entry(row)
+        current[index] = (mail_addr, mail_hashes[mail_addr], fingerprint_entry(merge_fields, tags))
+    known = get_fingerprints(conn, list_id, [mail_h for mail_addr, mail_h, fp in current.values()])
+
+    changed_index = [index for index, (mail_addr, mail_h, fp) in current.items() if known.get(mail_h) != fp]
+    pending = {current[index][0]: current[index][1:] for index in changed_index}
+    logger.info("Sync state: %d of %d entries are new or changed.", len(changed_index), len(current))
+
+    return df_to_mc.loc[changed_index], pending
+
+
+def record_synced(conn, list_id, pending, errors=None):
+    """Stores the fingerprints of all entries that were sent without errors.
+
+    Args:
+        conn ([Connection]): Connection to the sync state store.
+        list_id ([str]): ID of the mailchimp list.
+        pending ([dict]): Mapping of mail address to (subscriber hash, fingerprint) as returned by filter_changed().
+        errors ([dict], optional): Mapping of mail address to error message of entries that failed. Defaults to None.
+    """
+    errors = errors or {}
+    synced_at = datetime.now().isoformat(timespec='seconds')
+    rows = [(list_id, mail_h, fp, synced_at) for mail_addr, (mail_h, fp) in pending.items() if mail_addr not in errors]
+    conn.executemany("INSERT OR REPLACE INTO synced_contacts (list_id, subscriber_hash, fingerprint, synced_at) "
+                     "VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
@@ -0,0 +1,60 @@
+import os
+import re
+from collections import namedtuple
+
+# One mailchimp audience the contacts are sent to, rate_limit and max_connections of 0 keep the global settings
+Target = namedtuple('Target', ['name', 'mc_api_key', 'mc_server', 'list_id', 'rate_limit', 'max_connections'])
+
+
+def read_targets(env, names, dry_run=False):
+    """Reads the settings of the given targets from the environment. The settings of a target named 'main' are
+        MAILCHIMP_MAIN_API_KEY, MAILCHIMP_MAIN_SERVER, MAILCHIMP_MAIN_LIST_ID and optionally
+        MAILCHIMP_MAIN_RATE_LIMIT and MAILCHIMP_MAIN_MAX_CONNECTIONS.
+
+    Args:
+        env ([Env]): Environment with the settings, e.g. environs.Env after read_env().
+        names ([list]): Names of the targets, letters, digits and underscores only.
+        dry_run (bool, optional): Account and list are optional, like for a dry run without targets.
+            Defaults to False.
+
+    Returns:
+        [list]: One Target per name.
+    """
+    targets = []
+    for name in names:
+        if not re.fullmatch(r'\w+', name):
+            raise ValueError(f"Invalid target name '{name}', use letters, digits and underscores only.")
+        prefix = f"MAILCHIMP_{name.upper()}_"
+        if dry_run:
+            account = (env(prefix + "API_KEY", "dry-run-us1"), env(prefix + "SERVER", "us1"),
+                       env(prefix + "LIST_ID", f"dry-run-{name}"))
+        else:
+            account = (env(prefix + "API_KEY"), env(prefix + "SERVER"), env(prefix + "LIST_ID"))
+        rate_limit = env.float(prefix + "RATE_LIMIT", 0.0)
+        if rate_limit < 0:
+            raise ValueError(f"{prefix}RATE_LIMIT must not be negative, got {rate_limit}.")
+        targets.append(Target(name, *account, rate_limit, env.int(prefix + "MAX_CONNECTIONS", 0)))
+
+    return targets
+
+
+def get_target_path(fpath, target):
+    """Returns the path of a per-target file, e.g. a journal, in a subfolder named like the target."""
+    folder = os.path.join(os.path.dirname(fpath), target.name)
+    os.makedirs(folder, exist_ok=True)
+
+    return os.path.join(folder, os.path.basename(fpath))
+
+
+def get_target_send_opts(send_opts, target, send_mode='serial'):
+    """Returns the send options with the rate limit and connections of the target, which only apply to the
+        concurrent mode.
+    """
+    send_opts = dict(send_opts or {})
+    if send_mode == 'concurrent':
+        if target.rate_limit:
+            send_opts['rate_limit'] = target.rate_limit
+        if target.max_connections:
+            send_opts['max_workers'] = target.max_connections
+
+    return send_opts
@@ -0,0 +1,125 @@
+import logging
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # only available on Linux and if installed, the folder is polled otherwise
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_signature(fpath):
+    """Returns size and modification time of the file, None if it does not exist (anymore)."""
+    try:
+        stat = os.stat(fpath)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+class FolderWatcher:
+    """Watches a folder for new and changed files and reports them once they are completely written.
+        A file counts as complete once its size and modification time did not change for settle_seconds, so that
+        exports which are still copied or uploaded are not read half-way. Changes are noticed with inotify where
+        available, otherwise the folder is listed every poll_interval seconds.
+
+    Args:
+        path ([str]): Folder that is watched.
+        match ([function]): Called with a file name, returns True for the files that shall be reported.
+        poll_interval (float, optional): Seconds between two checks of the folder. Defaults to 1.0.
+        settle_seconds (float, optional): Seconds a file must stay unchanged to count as complete. Defaults to 2.0.
+        use_inotify (bool, optional): Use inotify if it is available. Defaults to True.
+    """
+
+    def __init__(self, path, match, poll_interval=1.0, settle_seconds=2.0, use_inotify=True):
+        self.path = path
+        self.match = match
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        # files that are still written: name -> (signature, time it was seen first with this signature)
+        self.pending = {}
+        # files that were reported: name -> signature at that time, reported again only if they change
+        self.reported = {}
+        self.inotify = None
+        if use_inotify and INotify is not None:
+            self.inotify = INotify()
+            self.inotify.add_watch(path, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO)
+        logger.info("Watching %s for new files (%s).", path, 'inotify' if self.inotify else 'polling')
+        # files that are already there are handled like new ones
+        for fname in sorted(os.listdir(path)):
+            self.add_candidate(fname)
+
+    def add_candidate(self, fname):
+        if fname in self.pending or not self.match(fname):
+            return
+        signature = get_signature(os.path.join(self.path, fname))
+        if signature is not None and self.reported.get(fname) != signature:
+            self.pending[fname] = (signature, time.monotonic())
+
+    def wait_for_changes(self):
+        """Blocks up to poll_interval seconds and adds the files that were created or changed meanwhile."""
+        if self.inotify is not None:
+            timeout = self.poll_interval if not self.pending else min(self.poll_interval, self.settle_seconds)
+            for event in self.inotify.read(timeout=int(timeout * 1000)):
+                if event.name:
+                    self.add_candidate(event.name)
+        else:
+            time.sleep(self.poll_interval)
+            for fname in sorted(os.listdir(self.path)):
+                self.add_candidate(fname)
+
+    def get_complete_files(self):
+        """Returns the pending files that did not change for settle_seconds, in the order they were seen."""
+        now = time.monotonic()
+        complete = []
+        for fname, (signature, since) in list(self.pending.items()):
+            current = get_signature(os.path.join(self.path, fname))
+            if current is None:
+                del self.pending[fname]
+            elif current != signature:
+                self.pending[fname] = (current, now)
+            elif now - since >= self.settle_seconds:
+                del self.pending[fname]
+                self.reported[fname] = current
+                complete.append(fname)
+
+        return complete
+
+    def forget(self, fname):
+        """Forgets a reported file, e.g. after it was archived, so that a new file with its name is reported."""
+        self.reported.pop(fname, None)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+def watch(path, match, handle_file, poll_interval=1.0, settle_seconds=2.0, stop_event=None):
+    """Calls handle_file for every matching file in the folder once it is completely written, until stop_event
+        is set. Files that are in the folder at the start are handled first. A file is only handled again if it
+        changes. Errors of handle_file are logged and do not stop the watch.
+
+    Args:
+        path ([str]): Folder that is watched.
+        match ([function]): Called with a file name, returns True for the files that shall be handled.
+        handle_file ([function]): Called with the name of every complete file.
+        poll_interval (float, optional): Seconds between two checks of the folder. Defaults to 1.0.
+        settle_seconds (float, optional): Seconds a file must stay unchanged to count as complete. Defaults to 2.0.
+        stop_event (Event, optional): Stops the watch once it is set. Defaults to None, i.e. watch forever.
+    """
+    watcher = FolderWatcher(path, match, poll_interval, settle_seconds)
+    try:
+        while stop_event is None or not stop_event.is_set():
+            for fname in watcher.get_complete_files():
+                try:
+                    handle_file(fname)
+                except Exception:
+                    logger.exception("File %s could not be processed, it is tried again once it changes.", fname)
+                if not os.path.exists(os.path.join(path, fname)):
+                    watcher.forget(fname)
+            watcher.wait_for_changes()
+    finally:
+        watcher.close()
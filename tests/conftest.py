@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+import src.fake_mailchimp as fm
+
+LIST_ID = 'test-list'
+
+
+@pytest.fixture
+def start_fake_server():
+    """Starts local mailchimp stand-in servers with the given faults, see fm.FakeMailchimpState, and stops them after
+        the test. Returns the server and the API base URL.
+    """
+    servers = []
+
+    def start(**faults):
+        server, url = fm.start_server(**faults)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_contacts(mail_addrs, tags=('Einzelspender/in',)):
+    """Builds contacts in the format returned by pf.process_to_mailchimp() for the given mail addresses."""
+    return pd.DataFrame({
+        'Email Address': list(mail_addrs),
+        'First Name': [f'First {i}' for i in range(len(mail_addrs))],
+        'Last Name': 'Last',
+        'Address': '',
+        'Address_dict': [{"addr1": f"Street {i}", "city": "Berlin", "state": "", "zip": "10115", "country": "DE"}
+                         for i in range(len(mail_addrs))],
+        'Phone': '',
+        'Tags': [list(tags)] * len(mail_addrs),
+    })
@@ -0,0 +1,38 @@
+"""Checks the requests the mailchimp client sends through its pooled session."""
+import requests
+import src.helper_functions as hf
+
+
+class RecordingSession:
+    """Stands in for a requests session, records every request and answers it with an empty json object."""
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append(dict(kwargs, method=method, url=url))
+        res = requests.Response()
+        res.status_code = 200
+        res.headers['content-type'] = 'application/json'
+        res._content = b'{"lists": []}'
+
+        return res
+
+
+def test_requests_to_the_data_center_carry_the_api_key():
+    session = RecordingSession()
+    client = hf.get_mailchimp_client('secret-us6', 'us6', session=session)
+
+    client.lists.get_all_lists()
+
+    assert session.requests[0]['url'] == 'https://us6.api.mailchimp.com/3.0/lists'
+    assert session.requests[0]['auth'] == ('user', 'secret-us6')
+
+
+def test_requests_without_credentials_do_not_carry_the_api_key():
+    session = RecordingSession()
+    client = hf.get_mailchimp_client('secret-us6', 'us6', session=session)
+
+    client.api_client.request('GET', 'https://results.example.org/batch.tar.gz', headers={}, with_credentials=False)
+
+    assert session.requests[0]['auth'] is None
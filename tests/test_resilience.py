@@ -0,0 +1,73 @@
+"""Checks retries, the circuit breaker and the dead letter file against the faults of the stand-in server."""
+import pandas as pd
+import pytest
+import main
+import src.resilience as rs
+from tests.conftest import LIST_ID, make_contacts
+
+
+@pytest.mark.parametrize('send_mode, send_opts', [
+    ('serial', {}),
+    ('concurrent', {'max_workers': 4, 'rate_limit': 1000.0}),
+])
+@pytest.mark.parametrize('faults', [{'throttle_rate': 0.3, 'retry_after': 0.0}, {'error_rate': 0.3}])
+def test_throttled_and_failed_requests_are_retried(start_fake_server, tmp_path, send_mode, send_opts, faults):
+    server, url = start_fake_server(**faults)
+    df_contacts = make_contacts([f'donor{i}@example.org' for i in range(10)])
+    dead_letter_file = str(tmp_path / 'failed.csv')
+
+    errors = main.send_contacts(df_contacts, LIST_ID, 'key-us1', 'us1', send_mode, dict(send_opts, host=url),
+                                dead_letter_file=dead_letter_file)
+
+    assert errors == {}
+    assert sum(server.state.faults.values()) > 0
+    assert len(server.state.get_list(LIST_ID)) == 10
+    assert not (tmp_path / 'failed.csv').exists()
+
+
+def test_contacts_are_dead_lettered_when_retries_are_exhausted(start_fake_server, tmp_path):
+    server, url = start_fake_server(error_rate=1.0)
+    df_contacts = make_contacts(['donor@example.org'])
+    dead_letter_file = str(tmp_path / 'failed.csv')
+
+    errors = main.send_contacts(df_contacts, LIST_ID, 'key-us1', 'us1', 'serial', {'host': url, 'max_retries': 1},
+                                dead_letter_file=dead_letter_file)
+
+    assert list(errors) == ['donor@example.org']
+    assert not rs.is_final(errors['donor@example.org'])
+    df_failed = pd.read_csv(dead_letter_file)
+    assert df_failed['Email Address'].tolist() == ['donor@example.org']
+    assert 'Internal Server Error' in df_failed['error'][0]
+    # first attempt and one retry of the create, the update and the tags
+    assert server.state.requests == 6
+
+
+def test_retry_after_is_honored_up_to_the_maximal_delay():
+    policy = rs.RetryPolicy(base_delay=0.5, max_delay=10.0)
+
+    assert policy.get_delay(0, '3') == 3.0
+    assert policy.get_delay(0, '60') == 10.0
+    assert all(0 <= policy.get_delay(2) <= 2.0 for _ in range(100))
+
+
+def test_circuit_breaker_stays_open_after_max_trips():
+    breaker = rs.CircuitBreaker(window=4, threshold=0.5, min_calls=4, cooldown=0.0, max_trips=2)
+    for success in [True, False, True, False]:
+        breaker.record(success)
+    breaker.before_call()
+    for success in [False] * 4:
+        breaker.record(success)
+
+    with pytest.raises(rs.CircuitOpenError):
+        breaker.before_call()
+
+
+def test_concurrency_shrinks_on_throttling_and_grows_back():
+    concurrency = rs.AdaptiveConcurrency(8)
+
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+    for _ in range(4):
+        concurrency.on_success()
+
+    assert concurrency.limit == 5
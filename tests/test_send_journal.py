@@ -0,0 +1,101 @@
+"""Checks that the send journal resumes where a run stopped and when it is complete."""
+import pytest
+import main
+import src.metrics as mt
+import src.process_files as pf
+import src.resilience as rs
+import src.send_journal as sj
+from tests.conftest import LIST_ID, make_contacts
+
+
+def test_rejected_contacts_complete_the_journal(start_fake_server, tmp_path):
+    server, url = start_fake_server()
+    df_contacts = make_contacts(['donor@example.org', 'not-a-mail-address'])
+    journal_file = str(tmp_path / 'journal.jsonl')
+    dead_letter_file = str(tmp_path / 'failed.csv')
+
+    errors = sj.send_with_journal(lambda df_batch: pf.send_entries_to_mailchimp(df_batch, LIST_ID, 'key-us1', 'us1',
+                                                                                 host=url),
+                                  df_contacts, journal_file)
+    rs.write_dead_letter(df_contacts, errors, dead_letter_file)
+
+    assert list(errors) == ['not-a-mail-address']
+    acknowledged, complete = sj.read_journal(journal_file)
+    assert complete
+    assert acknowledged == {'donor@example.org', 'not-a-mail-address'}
+    assert 'not-a-mail-address' in (tmp_path / 'failed.csv').read_text()
+
+
+def test_server_errors_keep_the_journal_incomplete(start_fake_server, tmp_path):
+    server, url = start_fake_server(error_rate=1.0)
+    df_contacts = make_contacts(['donor@example.org'])
+    journal_file = str(tmp_path / 'journal.jsonl')
+
+    errors = sj.send_with_journal(lambda df_batch: pf.send_entries_to_mailchimp(df_batch, LIST_ID, 'key-us1', 'us1',
+                                                                                 host=url, max_retries=0),
+                                  df_contacts, journal_file)
+
+    assert list(errors) == ['donor@example.org']
+    assert sj.read_journal(journal_file) == (set(), False)
+
+
+def test_rerun_skips_the_slices_sent_before_a_crash(start_fake_server, tmp_path):
+    server, url = start_fake_server()
+    df_contacts = make_contacts([f'donor{i}@example.org' for i in range(5)])
+    journal_file = str(tmp_path / 'journal.jsonl')
+    sent = []
+
+    def send_and_crash(df_batch):
+        if sent:
+            raise RuntimeError("run died")
+        sent.extend(df_batch['Email Address'])
+        return pf.send_entries_to_mailchimp(df_batch, LIST_ID, 'key-us1', 'us1', host=url)
+
+    with pytest.raises(RuntimeError):
+        sj.send_with_journal(send_and_crash, df_contacts, journal_file, batch_size=2)
+    assert sj.read_journal(journal_file) == ({'donor0@example.org', 'donor1@example.org'}, False)
+
+    resent = []
+
+    def send(df_batch):
+        resent.extend(df_batch['Email Address'])
+        return pf.send_entries_to_mailchimp(df_batch, LIST_ID, 'key-us1', 'us1', host=url)
+
+    assert sj.send_with_journal(send, df_contacts, journal_file, batch_size=2) == {}
+    assert resent == ['donor2@example.org', 'donor3@example.org', 'donor4@example.org']
+    assert sj.is_complete(journal_file)
+    assert len(server.state.get_list(LIST_ID)) == 5
+
+
+def test_complete_journal_sends_nothing(tmp_path):
+    journal_file = str(tmp_path / 'journal.jsonl')
+    sj.mark_complete(journal_file)
+
+    def send(df_batch):
+        raise AssertionError("nothing must be sent")
+
+    assert sj.send_with_journal(send, make_contacts(['donor@example.org']), journal_file) == {}
+
+
+def test_journal_is_keyed_by_the_file_content(tmp_path):
+    (tmp_path / 'export.csv').write_text('a;b\n1;2\n')
+    journal_file = sj.get_journal_file(str(tmp_path / 'journal'), ['export.csv'], str(tmp_path) + '/')
+    assert sj.get_journal_file(str(tmp_path / 'journal'), ['export.csv'], str(tmp_path) + '/') == journal_file
+
+    (tmp_path / 'export.csv').write_text('a;b\n1;3\n')
+
+    assert sj.get_journal_file(str(tmp_path / 'journal'), ['export.csv'], str(tmp_path) + '/') != journal_file
+
+
+def test_slices_of_a_journal_load_the_audience_once(start_fake_server, tmp_path):
+    server, url = start_fake_server()
+    df_contacts = make_contacts([f'donor{i}@example.org' for i in range(1200)])
+    journal_file = str(tmp_path / 'journal.jsonl')
+
+    errors, metrics = mt.collect(main.send_contacts, df_contacts, LIST_ID, 'key-us1', 'us1', 'serial',
+                                 {'host': url, 'prefetch': True}, '', journal_file)
+
+    assert errors == {}
+    assert sj.is_complete(journal_file)
+    loads = [call for call in metrics['api_calls'] if call['endpoint'] == 'GET /lists/{id}/members']
+    assert sum(call['calls'] for call in loads) == 1
@@ -0,0 +1,117 @@
+"""Sends contacts with every sender to the local mailchimp stand-in server and checks what arrives."""
+import pytest
+import src.helper_functions as hf
+import src.mailchimp_batch as mcb
+import src.process_files as pf
+import src.resilience as rs
+from tests.conftest import LIST_ID, make_contacts
+
+SEND_OPTS = {
+    'serial': {},
+    'concurrent': {'max_workers': 4, 'rate_limit': 1000.0},
+    'bulk': {'poll_interval': 0.01},
+}
+
+
+@pytest.mark.parametrize('send_mode', list(SEND_OPTS))
+def test_sender_creates_members_with_tags(start_fake_server, send_mode):
+    server, url = start_fake_server()
+    df_contacts = make_contacts([f'donor{i}@example.org' for i in range(25)])
+
+    errors = pf.get_sender(send_mode)(df_contacts, LIST_ID, 'key-us1', 'us1', host=url, **SEND_OPTS[send_mode])
+
+    assert errors == {}
+    members = server.state.get_list(LIST_ID)
+    assert len(members) == 25
+    member = members[hf.hash_string('donor3@example.org')]
+    assert member['merge_fields']['FNAME'] == 'First 3'
+    assert member['tags'] == ['Einzelspender/in']
+
+
+@pytest.mark.parametrize('send_mode', list(SEND_OPTS))
+def test_sender_reports_rejected_contacts(start_fake_server, send_mode):
+    server, url = start_fake_server()
+    df_contacts = make_contacts(['donor@example.org', 'not-a-mail-address'])
+
+    errors = pf.get_sender(send_mode)(df_contacts, LIST_ID, 'key-us1', 'us1', host=url, **SEND_OPTS[send_mode])
+
+    assert list(errors) == ['not-a-mail-address']
+    assert 'looks fake or invalid' in errors['not-a-mail-address']
+    assert rs.is_final(errors['not-a-mail-address'])
+    assert list(server.state.get_list(LIST_ID)) == [hf.hash_string('donor@example.org')]
+
+
+def test_batch_add_tags_reports_failed_operations(start_fake_server):
+    server, url = start_fake_server()
+    client = pf.get_client('key-us1', 'us1', url)
+    mcb.batch_upsert_members(client, LIST_ID, [{"email_address": "donor@example.org", "status": "subscribed"}])
+
+    errors = mcb.batch_add_tags(client, LIST_ID, {'donor@example.org': ['a'], 'unknown@example.org': ['a']},
+                                poll_interval=0.01)
+
+    assert list(errors) == ['unknown@example.org']
+    assert errors['unknown@example.org'].status_code == 404
+    assert server.state.get_list(LIST_ID)[hf.hash_string('donor@example.org')]['tags'] == ['a']
+
+
+def test_batch_add_tags_fails_all_operations_if_the_batch_is_not_started(start_fake_server):
+    server, url = start_fake_server(error_rate=1.0)
+    client = pf.get_client('key-us1', 'us1', url, max_retries=0)
+
+    errors = mcb.batch_add_tags(client, LIST_ID, {'a@example.org': ['a'], 'b@example.org': ['a']})
+
+    assert sorted(errors) == ['a@example.org', 'b@example.org']
+    assert not any(rs.is_pending(error) for error in errors.values())
+
+
+def test_batch_add_tags_reports_unfinished_batch_as_pending(start_fake_server):
+    server, url = start_fake_server()
+    client = pf.get_client('key-us1', 'us1', url)
+    client.batches.status = lambda batch_id: {'id': batch_id, 'status': 'started'}
+
+    errors = mcb.batch_add_tags(client, LIST_ID, {'a@example.org': ['a'], 'b@example.org': ['a']},
+                                poll_interval=0.01, timeout=0.05)
+
+    assert sorted(errors) == ['a@example.org', 'b@example.org']
+    assert all(rs.is_pending(error) for error in errors.values())
+
+
+def test_batch_add_tags_fails_all_operations_if_the_results_are_lost(start_fake_server):
+    server, url = start_fake_server()
+    client = pf.get_client('key-us1', 'us1', url)
+    start_batch = client.batches.start
+
+    def start_and_lose_results(body):
+        response = start_batch(body)
+        server.state.results.clear()
+        return response
+
+    client.batches.start = start_and_lose_results
+
+    errors = mcb.batch_add_tags(client, LIST_ID, {'a@example.org': ['a'], 'b@example.org': ['a']},
+                                poll_interval=0.01)
+
+    assert sorted(errors) == ['a@example.org', 'b@example.org']
+
+
+def test_pending_contacts_are_not_synced_nor_dead_lettered(start_fake_server, tmp_path, monkeypatch):
+    server, url = start_fake_server()
+    df_contacts = make_contacts(['a@example.org', 'b@example.org'])
+    state_path = str(tmp_path / 'sync_state.sqlite')
+    dead_letter_file = str(tmp_path / 'failed.csv')
+
+    def time_out(client, batch_id, poll_interval=2.0, timeout=600.0):
+        raise TimeoutError(f"Batch {batch_id} not finished.")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(mcb, 'poll_batch_status', time_out)
+        errors = pf.send_changed_entries(df_contacts, LIST_ID, 'key-us1', 'us1', 'bulk', state_path, host=url)
+    rs.write_dead_letter(df_contacts, errors, dead_letter_file)
+
+    assert all(rs.is_pending(error) for error in errors.values()) and len(errors) == 2
+    assert not (tmp_path / 'failed.csv').exists()
+    # the next run sends the pending contacts again
+    requests_before = server.state.requests
+    assert pf.send_changed_entries(df_contacts, LIST_ID, 'key-us1', 'us1', 'bulk', state_path, host=url,
+                                   poll_interval=0.01) == {}
+    assert server.state.requests > requests_before
@@ -0,0 +1,62 @@
+"""Checks the transforms compiled from the declarations in src/sources.py against the row-wise legacy transforms."""
+import pandas as pd
+import pytest
+import src.helper_functions as hf
+import src.sources as sr
+from benchmarks import generate_data as gd
+from benchmarks import legacy_process_files as legacy
+
+CASES = [
+    ('is_FundraisingBox', gd.generate_fundraisingbox, legacy.from_fundraisingbox),
+    ('is_twingle', gd.generate_twingle, legacy.from_twingle),
+]
+
+
+def load_export(df_generated, tmp_path, fname, schema=None):
+    """Writes a generated export and reads it back like main.load_and_aggregate() does, so dtypes are realistic."""
+    gd.to_export(df_generated, str(tmp_path / fname))
+
+    return hf.load_file(fname, str(tmp_path) + '/', ';', schema=schema)
+
+
+@pytest.mark.parametrize('n_rows', [20, 500])
+@pytest.mark.parametrize('what_file, generate, legacy_transform', CASES)
+def test_compiled_transform_matches_legacy(tmp_path, what_file, generate, legacy_transform, n_rows):
+    df_file = load_export(generate(n_rows, seed=n_rows), tmp_path, f'{what_file}.csv')
+
+    df_compiled = sr.get_transform(what_file)(df_file)
+
+    pd.testing.assert_frame_equal(df_compiled, legacy_transform(df_file)[sr.OUTPUT_COLUMNS])
+
+
+@pytest.mark.parametrize('what_file, generate, legacy_transform', CASES)
+def test_compiled_transform_on_typed_load(tmp_path, what_file, generate, legacy_transform):
+    df_untyped = load_export(generate(500), tmp_path, f'{what_file}.csv')
+    df_typed = hf.load_file(f'{what_file}.csv', str(tmp_path) + '/', ';', schema=sr.get_source(what_file).schema)
+
+    df_compiled = sr.get_transform(what_file)(df_typed)
+
+    # the same contacts agree to the newsletter, whatever dtypes the export is read with
+    assert df_compiled.index.equals(legacy_transform(df_untyped).index)
+    assert list(df_compiled.columns) == sr.OUTPUT_COLUMNS
+
+
+def test_json_consent_missing_key_counts_as_empty():
+    meta_infos = pd.Series(['{"wants_newsletter": "1"}', '{"item_id": 1}', '{"wants_newsletter": "1"}',
+                            '{"wants_newsletter": 1}'])
+
+    consents = sr.get_consents(meta_infos, sr.Consent('donation_meta_info', '1', json_key='wants_newsletter'))
+
+    assert consents.tolist() == [True, False, True, False]
+
+
+def test_unknown_source_is_rejected():
+    with pytest.raises(ValueError):
+        sr.get_source('is_unknown')
+
+
+def test_source_without_all_output_columns_is_rejected():
+    source = sr.get_source('is_twingle')._replace(name='incomplete', columns={'email_address': 'user_email'})
+
+    with pytest.raises(ValueError):
+        sr.compile_transform(source)
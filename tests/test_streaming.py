@@ -0,0 +1,49 @@
+"""Checks that streaming an export in chunks gives the same aggregate as processing it at once."""
+import pandas as pd
+import pytest
+import main
+import src.helper_functions as hf
+import src.sources as sr
+from benchmarks import generate_data as gd
+
+COLS_FOR_CHIMP = ['email_address', 'first_name', 'last_name', 'address_for_chimp', 'address_for_chimp_dict', 'phone',
+                  'donation_id', 'ist_dauerspender', 'ist_einzelspender']
+
+CASES = [
+    ('is_FundraisingBox', gd.generate_fundraisingbox),
+    ('is_twingle', gd.generate_twingle),
+]
+
+
+@pytest.mark.parametrize('chunksize', [20, 333])
+@pytest.mark.parametrize('what_file, generate', CASES)
+def test_chunked_aggregate_matches_whole_file(tmp_path, what_file, generate, chunksize):
+    # some postal codes are missing, so without fixed dtypes some chunks would read them as floats and others as ints
+    gd.to_export(generate(2000, seed=chunksize), str(tmp_path / f'{what_file}.csv'))
+    data_path = str(tmp_path) + '/'
+
+    df_whole = main.load_and_aggregate(COLS_FOR_CHIMP, data_path, f'{what_file}.csv', '', what_file,
+                                       typed_load=True)
+    df_chunked = main.load_and_aggregate(COLS_FOR_CHIMP, data_path, f'{what_file}.csv', '', what_file,
+                                         chunksize=chunksize, typed_load=False)
+
+    pd.testing.assert_frame_equal(df_chunked.sort_index(), df_whole.sort_index())
+
+
+@pytest.mark.parametrize('what_file, generate', CASES)
+def test_export_with_a_missing_id_is_loaded(tmp_path, what_file, generate):
+    df_export = generate(200)
+    id_col = sr.get_source(what_file).columns['donation_id']
+    df_export[id_col] = df_export[id_col].astype('Int64')
+    df_export.loc[5, id_col] = pd.NA
+    gd.to_export(df_export, str(tmp_path / f'{what_file}.csv'))
+    data_path = str(tmp_path) + '/'
+
+    df_file = hf.load_file(f'{what_file}.csv', data_path, ';', schema=sr.get_source(what_file).schema)
+    df_whole = main.load_and_aggregate(COLS_FOR_CHIMP, data_path, f'{what_file}.csv', '', what_file,
+                                       typed_load=True)
+    df_chunked = main.load_and_aggregate(COLS_FOR_CHIMP, data_path, f'{what_file}.csv', '', what_file,
+                                         chunksize=50)
+
+    assert df_file[id_col].isna().sum() == 1
+    pd.testing.assert_frame_equal(df_chunked.sort_index(), df_whole.sort_index())
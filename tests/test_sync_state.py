@@ -0,0 +1,63 @@
+"""Checks that only new or changed contacts are sent when the sync state is used."""
+import src.helper_functions as hf
+import src.process_files as pf
+from tests.conftest import LIST_ID, make_contacts
+
+
+def send_changed(df_contacts, url, state_path, list_id=LIST_ID):
+    return pf.send_changed_entries(df_contacts, list_id, 'key-us1', 'us1', 'serial', state_path, host=url)
+
+
+def test_unchanged_contacts_are_not_sent_again(start_fake_server, tmp_path):
+    server, url = start_fake_server()
+    df_contacts = make_contacts([f'donor{i}@example.org' for i in range(10)])
+    state_path = str(tmp_path / 'sync_state.sqlite')
+    assert send_changed(df_contacts, url, state_path) == {}
+    requests_first_run = server.state.requests
+
+    assert send_changed(df_contacts, url, state_path) == {}
+
+    assert server.state.requests == requests_first_run
+
+
+def test_only_changed_contacts_are_sent(start_fake_server, tmp_path, monkeypatch):
+    server, url = start_fake_server()
+    df_contacts = make_contacts([f'donor{i}@example.org' for i in range(10)])
+    state_path = str(tmp_path / 'sync_state.sqlite')
+    send_changed(df_contacts, url, state_path)
+    sent = []
+    send_entries = pf.send_entries_to_mailchimp
+
+    def record_sent(df_to_mc, *args, **kwargs):
+        sent.extend(df_to_mc['Email Address'])
+        return send_entries(df_to_mc, *args, **kwargs)
+
+    monkeypatch.setattr(pf, 'send_entries_to_mailchimp', record_sent)
+    df_changed = df_contacts.copy()
+    df_changed.loc[3, 'First Name'] = 'Changed'
+    df_changed.at[7, 'Tags'] = ['Dauerspender/in']
+
+    assert send_changed(df_changed, url, state_path) == {}
+
+    assert sent == ['donor3@example.org', 'donor7@example.org']
+    assert server.state.get_list(LIST_ID)[hf.hash_string('donor3@example.org')]['merge_fields']['FNAME'] == 'Changed'
+
+
+def test_failed_contacts_are_sent_again(start_fake_server, tmp_path):
+    server, url = start_fake_server()
+    df_contacts = make_contacts(['donor@example.org', 'not-a-mail-address'])
+    state_path = str(tmp_path / 'sync_state.sqlite')
+    assert list(send_changed(df_contacts, url, state_path)) == ['not-a-mail-address']
+
+    assert list(send_changed(df_contacts, url, state_path)) == ['not-a-mail-address']
+
+
+def test_sync_state_is_kept_per_list(start_fake_server, tmp_path):
+    server, url = start_fake_server()
+    df_contacts = make_contacts(['donor@example.org'])
+    state_path = str(tmp_path / 'sync_state.sqlite')
+    send_changed(df_contacts, url, state_path)
+
+    send_changed(df_contacts, url, state_path, list_id='other-list')
+
+    assert list(server.state.get_list('other-list')) == list(server.state.get_list(LIST_ID))